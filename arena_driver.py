@@ -0,0 +1,474 @@
+""" Drives a game round against the bots with asyncio. """
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import instrumentation
+from binary_protocol import BINARY_PROTOCOL, Traffic
+from bot_stream import BotReply, BotStream
+from game.arena import Arena
+from game_log import GameLog
+from instrumentation import METRICS, Histogram, timed, write_summary
+from settings import BOT_TIME_BUDGET, TIMEOUT_ACK, TIMEOUT_DEFUSE, TIMEOUT_PLAY, WIRE_PROTOCOLS
+
+ACTION_TIMEOUTS = {
+    'START': TIMEOUT_ACK,
+    'DRAW': TIMEOUT_ACK,
+    'PLAY': TIMEOUT_PLAY,
+    'DEFUSE': TIMEOUT_DEFUSE,
+    'EXPLODE': TIMEOUT_ACK,
+    'FUTURE': TIMEOUT_ACK,
+    'INFORM': TIMEOUT_ACK,
+    'OVER': TIMEOUT_ACK,
+    'BATCH': TIMEOUT_ACK,
+}
+# Bots with this capability get their hand and the INFORM events in BATCH messages
+BATCH_CAPABILITY = 'batch'
+
+
+@dataclass
+class RoundResult:
+    logfile: str
+    ranking: List[str] = field(default_factory=list)
+    points: Dict[str, int] = field(default_factory=dict)
+    duration: float = 0.0
+    finished: bool = False
+    round_number: int = 0
+    traffic: Dict[str, Traffic] = field(default_factory=dict)
+    failures: Dict[str, int] = field(default_factory=dict)
+    turns: int = 0
+    exploded: List[str] = field(default_factory=list)
+    disqualified: List[str] = field(default_factory=list)
+    latencies: Dict[str, Histogram] = field(default_factory=dict)
+    seed: int = None
+    # The deal of a duplicate tournament, None otherwise
+    deal: int = None
+    # Why each exploded or disqualified bot went out
+    reasons: Dict[str, str] = field(default_factory=dict)
+    # The seconds each bot took to answer, timed out requests included
+    answer_latencies: Dict[str, List[float]] = field(default_factory=dict)
+
+
+class ArenaDriver:
+    """
+    Runs one round: asks the arena for the next turn and talks to the bots.
+    Bots with the batch capability, from the clowder registration or their
+    START reply, get the INFORM events queued and delivered in one BATCH
+    right before the next request to them. A registered capability also
+    lets the hand be dealt in one BATCH instead of one DRAW per card.
+    A bot that doesn't answer PLAY or DEFUSE in time, or has used up its
+    budget, draws a card or has the kitten put on top of the deck.
+    """
+
+    def __init__(self, bot_list: List[dict], game_log: GameLog, timeouts: Dict[str, float] = None,
+                 protocols: tuple = WIRE_PROTOCOLS, budget: float = BOT_TIME_BUDGET, seed: int = None):
+        self._bot_list = bot_list
+        self._seed = seed if seed is not None else new_seed()
+        self._protocols = protocols
+        self._log = game_log
+        self._timeouts = dict(ACTION_TIMEOUTS, **(timeouts or {}))
+        self._arena = Arena(verbose=instrumentation.VERBOSITY >= 1, rng=random.Random(self._seed))
+        self._streams = [
+            BotStream(bot['name'], bot['ip'], bot['port'], budget or None) for bot in bot_list
+        ]
+        self._batching = {
+            bot_number for bot_number, bot in enumerate(bot_list)
+            if BATCH_CAPABILITY in bot.get('capabilities', ())
+        }
+        self._pending = [[] for _ in bot_list]
+        self._ranking = []
+        self._points = {}
+        self._turns = 0
+        self._exploded = []
+
+    async def run(self) -> None:
+        """
+        Run the round and close all connections afterwards.
+        :return: None
+        """
+        try:
+            await self._play()
+        finally:
+            await asyncio.gather(*(stream.close() for stream in self._streams))
+
+    async def _play(self) -> None:
+        """
+        Play the round until only one bot is alive.
+        :return: None
+        """
+        bot_list = self._bot_list
+        arena = self._arena
+        self._log.write('Game', 'SEED', self._seed)
+        self._log.write('Game', 'START', ','.join([bot['name'] for bot in bot_list]))
+        alive_count = len(bot_list)
+        await self._start_round()
+        print('----------- Game Start -----------')
+        save_bot = -1
+        verbose = instrumentation.VERBOSITY >= 1
+        while alive_count > 1:
+            with timed('arena.take_turn'):
+                bot_number, action, data = arena.take_turn()
+            self._turns += 1
+            active_bot = bot_list[bot_number]
+            if verbose and bot_number != save_bot:
+                print(f'Active bot: {active_bot["name"]}')
+                save_bot = bot_number
+            if verbose:
+                print(f'  - Action={action} / Data={data}')
+            if action == 'PLAY':
+                response = await self._send(bot_number, {'action': action})
+                await self._inform_bots(active_bot['name'], 'PLAY', response)
+                self._log.write(active_bot['name'], action, response)
+            elif action == 'DRAW':
+                self._log.write(active_bot['name'], action, data)
+                if data == 'EXPLODING_KITTEN':
+                    response = None
+                else:
+                    response = await self._send(bot_number, {'action': 'DRAW', 'card': data})
+                    await self._inform_bots(active_bot['name'], 'DRAW', '')
+                if verbose:
+                    print(f'=> {arena.read_hand(bot_number)}')
+            elif action == 'DEFUSE':
+                response = await self._send(bot_number, {'action': 'DEFUSE', 'decksize': arena.deck_size})
+                if verbose:
+                    print(f'  => Bot {active_bot["name"]} defused the exploding kitten')
+                self._log.write(active_bot['name'], action, response)
+                await self._inform_bots(active_bot['name'], 'DEFUSE', '')
+            elif action == 'EXPLODE':
+                response = await self._send(bot_number, {'action': 'EXPLODE'})
+                if verbose:
+                    print(f'  => Bot {active_bot["name"]} exploded')
+                self._log.write(active_bot['name'], action, data)
+                alive_count -= 1
+                self._exploded.append(active_bot['name'])
+                await self._inform_bots(active_bot['name'], 'EXPLODE', '')
+            elif action == 'FUTURE':
+                response = await self._send(bot_number, {'action': 'FUTURE', 'cards': data})
+                self._log.write(active_bot['name'], action, data)
+            elif action == 'NEXTBOT':
+                response = None
+            if verbose:
+                print(f'  - Response={response}')
+            with timed('arena.analyze_turn'):
+                arena.analyze_turn(response)
+
+        await self._finish_round()
+
+    async def _start_round(self) -> None:
+        """
+        Deal the cards and inform all bots that the round has started.
+        :return: None
+        """
+        card_counts = self._arena.start_round(len(self._bot_list))
+        await self._give_cards()
+        data = {
+            'action': 'START',
+            'card_counts': [],
+            'bots': [bot['name'] for bot in self._bot_list],
+            'protocols': list(self._protocols),
+            'capabilities': [BATCH_CAPABILITY],
+        }
+        for card in dir(card_counts):
+            if not card.startswith('__'):
+                data['card_counts'].append(
+                    {
+                        'name': card,
+                        'count': getattr(card_counts, card),
+                    }
+                )
+        replies = await self._broadcast(data)
+        self._negotiate(data['bots'], replies)
+
+    def _negotiate(self, botnames: List[str], replies: Dict[str, BotReply]) -> None:
+        """
+        Upgrade the bots that chose the binary protocol or batching in their START reply.
+        :param botnames: the bot list of the START request
+        :param replies: the START replies
+        :return: None
+        """
+        for bot_number, stream in enumerate(self._streams):
+            response = replies[stream.name].response
+            if not isinstance(response, dict):
+                continue
+            if (BINARY_PROTOCOL in self._protocols and response.get('protocol') == BINARY_PROTOCOL
+                    and stream.upgrade(botnames)):
+                print(f'Main: {stream.name} uses the {BINARY_PROTOCOL} protocol')
+            if BATCH_CAPABILITY in response.get('capabilities', ()):
+                self._batching.add(bot_number)
+
+    async def _finish_round(self) -> None:
+        """
+        Log the ranking and inform all bots that the round has ended.
+        :return: None
+        """
+        print('----------- Game Over -----------')
+
+        ranking = []
+        rank = 1
+        self._log.write('Game', 'OVER', '')
+        for bot_number in self._arena.ranking:
+            bot_name = self._bot_list[bot_number]['name']
+            bot_points = self._arena.bot_ranking_points[bot_number]
+            print(f'{rank}. {bot_name} ({bot_points} Punkte)')
+            self._log.write(f'{rank}.', f'{bot_name}', f'{bot_points} Punkte')
+            ranking.append(bot_name)
+            self._points[bot_name] = bot_points
+            rank += 1
+        self._ranking = ranking
+
+        await asyncio.gather(*(self._flush(bot_number) for bot_number in self._batching))
+        await self._broadcast({'action': 'OVER', 'ranks': ranking})
+
+    async def _inform_bots(self, botname: str, action: str, response) -> None:
+        """
+        Inform all the bots of the action that just occurred.
+        :param botname: the name of the bot who took the action
+        :param action: the action
+        :param response: the response from the bot
+        :return: None
+        """
+        inform = {
+            'action': 'INFORM',
+            'botname': botname,
+            'event': action,
+            'data': response,
+        }
+        for bot_number in self._batching:
+            self._pending[bot_number].append(inform)
+        await self._broadcast(inform, [
+            bot_number for bot_number in range(len(self._streams)) if bot_number not in self._batching
+        ])
+
+    async def _give_cards(self) -> None:
+        """
+        Send each bot the cards of its hand.
+        :return: None
+        """
+        for bot_number, bot in enumerate(self._bot_list):
+            hand = self._arena.read_hand(bot_number)
+            if bot_number in self._batching:
+                messages = [{'action': 'DRAW', 'card': card} for card in hand]
+                await self._send(bot_number, {'action': 'BATCH', 'messages': messages})
+                for card in hand:
+                    self._log.write(bot['name'], 'DRAW', card)
+                continue
+            for card in hand:
+                await self._send(bot_number, {'action': 'DRAW', 'card': card})
+                self._log.write(bot['name'], 'DRAW', card)
+
+    async def _flush(self, bot_number: int) -> None:
+        """
+        Deliver the INFORM events queued for a bot, in one BATCH if there are several.
+        :param bot_number: the index of the bot
+        :return: None
+        """
+        pending = self._pending[bot_number]
+        if not pending:
+            return
+        self._pending[bot_number] = []
+        if len(pending) == 1:
+            action = pending[0]
+        else:
+            action = {'action': 'BATCH', 'messages': pending}
+        await self._request(bot_number, action)
+
+    async def _send(self, bot_number: int, action: dict):
+        """
+        Send an action to one bot and wait for the response.
+        :param bot_number: the index of the bot
+        :param action: the request content
+        :return: the decoded response for PLAY and DEFUSE, None otherwise
+        """
+        await self._flush(bot_number)
+        with timed('round.send'):
+            reply = await self._request(bot_number, action)
+        response = decode_response(action, reply.response)
+        if response is None and action['action'] in FALLBACKS:
+            response = FALLBACKS[action['action']](self._arena)
+            name = self._streams[bot_number].name
+            if not reply.timed_out and reply.error is None:
+                # Timeouts and connection errors are logged by _request, an unusable answer here
+                self._log.write(name, 'ERROR', {
+                    'action': action['action'],
+                    'error': f'unusable answer {reply.response!r}',
+                    'latency': round(reply.latency, 3),
+                    'fallback': response,
+                })
+            print(f'  => Bot {name} gave no answer, using {response}')
+        return response
+
+    async def _request(self, bot_number: int, action: dict) -> BotReply:
+        """
+        Send an action to one bot under the deadline of the action and log a timeout or an error.
+        :param bot_number: the index of the bot
+        :param action: the request content
+        :return: BotReply
+        """
+        stream = self._streams[bot_number]
+        timeout = self._timeouts[action['action']]
+        # Once the budget is used up only the fallbacks are logged
+        out_of_time = stream.budget is not None and stream.budget <= 0
+        # Every request of the round goes through here, timeouts and errors included
+        with timed('round.request'):
+            reply = await stream.request(action, timeout)
+        if reply.timed_out and (not out_of_time or action['action'] in FALLBACKS):
+            event = {
+                'action': action['action'],
+                'timeout': timeout,
+                'latency': round(reply.latency, 3),
+                'budget': None if stream.budget is None else round(max(0.0, stream.budget), 3),
+            }
+            if action['action'] in FALLBACKS:
+                event['fallback'] = FALLBACKS[action['action']](self._arena)
+            self._log.write(stream.name, 'TIMEOUT', event)
+        elif reply.error is not None:
+            event = {'action': action['action'], 'error': reply.error, 'latency': round(reply.latency, 3)}
+            if action['action'] in FALLBACKS:
+                event['fallback'] = FALLBACKS[action['action']](self._arena)
+            self._log.write(stream.name, 'ERROR', event)
+        return reply
+
+    async def _broadcast(self, action: dict, bot_numbers: List[int] = None) -> Dict[str, BotReply]:
+        """
+        Send the same action to the bots at once under one deadline.
+        :param action: the request content
+        :param bot_numbers: the indices of the bots, all bots if None
+        :return: dict of bot name -> BotReply
+        """
+        if bot_numbers is None:
+            bot_numbers = range(len(self._streams))
+        with timed('round.broadcast'):
+            replies = await asyncio.gather(*(self._request(bot_number, action) for bot_number in bot_numbers))
+        return {self._streams[bot_number].name: reply for bot_number, reply in zip(bot_numbers, replies)}
+
+    @property
+    def ranking(self) -> List[str]:
+        """ returns the bot names from winner to first exploded, empty before the round is over """
+        return self._ranking
+
+    @property
+    def points(self) -> Dict[str, int]:
+        """ returns the ranking points per bot name, empty before the round is over """
+        return self._points
+
+    @property
+    def seed(self) -> int:
+        """ returns the seed of the round """
+        return self._seed
+
+    @property
+    def turns(self) -> int:
+        """ returns the number of turns taken """
+        return self._turns
+
+    @property
+    def exploded(self) -> List[str]:
+        """ returns the names of the exploded bots in order """
+        return self._exploded
+
+    @property
+    def disqualified(self) -> List[str]:
+        """ returns the names of the disqualified bots """
+        return [self._bot_list[bot_number]['name'] for bot_number in self._arena.disqualified]
+
+    @property
+    def reasons(self) -> Dict[str, str]:
+        """ returns why each exploded or disqualified bot went out by bot name """
+        return {self._bot_list[bot_number]['name']: reason
+                for bot_number, reason in self._arena.explosion_reasons.items()}
+
+    @property
+    def answer_latencies(self) -> Dict[str, List[float]]:
+        """ returns the answer latencies per bot name """
+        return {stream.name: stream.latencies for stream in self._streams}
+
+    @property
+    def failures(self) -> Dict[str, int]:
+        """ returns the number of requests that timed out or failed per bot name """
+        return {stream.name: stream.failures for stream in self._streams}
+
+    @property
+    def traffic(self) -> Dict[str, Traffic]:
+        """ returns the messages and bytes exchanged with all bots per protocol """
+        traffic = {}
+        for stream in self._streams:
+            for protocol, counters in stream.traffic.items():
+                traffic.setdefault(protocol, Traffic()).add(counters)
+        return traffic
+
+
+def new_seed() -> int:
+    """
+    A fresh seed for a round.
+    :return: a 63 bit int
+    """
+    return random.SystemRandom().getrandbits(63)
+
+
+# The answer used when a bot doesn't answer in time
+FALLBACKS = {
+    'PLAY': lambda arena: 'NONE',
+    # A position past the deck puts the kitten on top
+    'DEFUSE': lambda arena: str(arena.deck_size),
+}
+
+
+def decode_response(action: dict, response):
+    """
+    Convert the response content, PLAY and DEFUSE answers are utf-8 text.
+    :param action: the request content
+    :param response: the response content
+    :return: the text of PLAY and DEFUSE responses, None otherwise
+    """
+    if action['action'] in ['PLAY', 'DEFUSE'] and isinstance(response, bytes):
+        return response.decode('utf-8')
+    return None
+
+
+async def run_round(bot_list: List[dict], game_log: GameLog, deadline: float, seed: int = None) -> RoundResult:
+    """
+    Run one round and cancel it when it takes longer than the deadline.
+    :param bot_list: the bots registered at the clowder
+    :param game_log: the log of this round, closed when the round is over
+    :param deadline: seconds the round may take
+    :param seed: the seed of the deck, a fresh one if None
+    :return: the RoundResult, finished is False if the round was cancelled
+    """
+    METRICS.reset()
+    driver = ArenaDriver(bot_list, game_log, seed=seed)
+    result = RoundResult(game_log.logfile, seed=driver.seed)
+    started = time.monotonic()
+    try:
+        await asyncio.wait_for(driver.run(), deadline)
+        result.finished = True
+    except asyncio.TimeoutError:
+        print(f'Round {game_log.logfile} is taking too long.')
+        game_log.write('Game', 'TIMEOUT', deadline)
+    finally:
+        game_log.close()
+    result.duration = time.monotonic() - started
+    result.ranking = driver.ranking
+    result.points = driver.points
+    result.traffic = driver.traffic
+    result.failures = driver.failures
+    result.turns = driver.turns
+    result.exploded = driver.exploded
+    result.disqualified = driver.disqualified
+    result.reasons = driver.reasons
+    result.answer_latencies = driver.answer_latencies
+    result.latencies = {
+        label: histogram for (name, label), histogram in METRICS.histograms.items() if name == 'request'
+    }
+    for protocol, traffic in result.traffic.items():
+        if traffic.messages:
+            print(f'Traffic {protocol}: {traffic.messages} messages, '
+                  f'{traffic.bytes_sent} bytes sent, {traffic.bytes_received} bytes received')
+            METRICS.count(f'{protocol} messages', traffic.messages)
+            METRICS.count(f'{protocol} bytes', traffic.bytes_sent + traffic.bytes_received)
+    try:
+        write_summary(game_log.path, f'Round {game_log.logfile}', result.duration)
+    except OSError as e:
+        print(f'Error: writing the summary of {game_log.logfile} failed: {e!r}')
+    return result
@@ -0,0 +1,102 @@
+"""
+Compares the bytes copied per message by the old and the new receive buffer.
+Both count every byte written into a buffer, the received bytes included.
+"""
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message import RecvBuffer, create_message, json_decode, json_encode
+
+
+class ChunkSocket:
+    """ Hands out the stream in chunks of at most 4096 bytes, like a busy socket. """
+
+    def __init__(self, stream):
+        self._stream = memoryview(stream)
+        self._offset = 0
+
+    def recv(self, size):
+        chunk = bytes(self._stream[self._offset:self._offset + size])
+        self._offset += len(chunk)
+        return chunk
+
+    def recv_into(self, buffer, size):
+        chunk = self._stream[self._offset:self._offset + size]
+        buffer[:len(chunk)] = chunk
+        self._offset += len(chunk)
+        return len(chunk)
+
+
+def read_legacy(sock, count):
+    """ The framing of the old Message: bytes +=, slicing for every header """
+    copied = 0
+    recv_buffer = b''
+    for _ in range(count):
+        jsonheader_len = jsonheader = None
+        while True:
+            if len(recv_buffer) < 2 + (jsonheader_len or 0) + (jsonheader or {}).get('content-length', 0):
+                data = sock.recv(4096)
+                recv_buffer += data
+                copied += len(recv_buffer)
+            if jsonheader_len is None and len(recv_buffer) >= 2:
+                jsonheader_len = struct.unpack('>H', recv_buffer[:2])[0]
+                recv_buffer = recv_buffer[2:]
+                copied += 2 + len(recv_buffer)
+            if jsonheader_len is not None and jsonheader is None and len(recv_buffer) >= jsonheader_len:
+                jsonheader = json_decode(recv_buffer[:jsonheader_len], 'utf-8')
+                recv_buffer = recv_buffer[jsonheader_len:]
+                copied += jsonheader_len + len(recv_buffer)
+            if jsonheader is not None and len(recv_buffer) >= jsonheader['content-length']:
+                content_len = jsonheader['content-length']
+                content = recv_buffer[:content_len]
+                recv_buffer = recv_buffer[content_len:]
+                copied += content_len + len(recv_buffer)
+                break
+    return copied
+
+
+def read_buffered(sock, count):
+    """ The framing of the new Message: recv_into a RecvBuffer, memoryviews for the headers """
+    copied = 0
+    recv_buffer = RecvBuffer()
+    for _ in range(count):
+        jsonheader_len = jsonheader = None
+        while True:
+            if len(recv_buffer) < 2 + (jsonheader_len or 0) + (jsonheader or {}).get('content-length', 0):
+                # The old path counts the received bytes with its +=
+                copied += recv_buffer.recv_into(sock)
+            if jsonheader_len is None and len(recv_buffer) >= 2:
+                jsonheader_len = struct.unpack('>H', recv_buffer.view(2))[0]
+                recv_buffer.consume(2)
+            if jsonheader_len is not None and jsonheader is None and len(recv_buffer) >= jsonheader_len:
+                jsonheader = json_decode(recv_buffer.view(jsonheader_len), 'utf-8')
+                recv_buffer.consume(jsonheader_len)
+            if jsonheader is not None and len(recv_buffer) >= jsonheader['content-length']:
+                content = recv_buffer.view(jsonheader['content-length'])
+                recv_buffer.consume(jsonheader['content-length'])
+                break
+    return copied + recv_buffer.bytes_copied
+
+
+if __name__ == '__main__':
+    print(f'{"payload":>10}{"old copied/msg":>18}{"new copied/msg":>18}{"old ms":>10}{"new ms":>10}')
+    for size in (100, 10_000, 100_000, 1_000_000):
+        count = max(10, 2_000_000 // size)
+        message = create_message(
+            content_bytes=json_encode({'action': 'DRAW', 'cards': 'x' * size}, 'utf-8'),
+            content_type='text/json',
+            content_encoding='utf-8',
+        )
+        stream = message * count
+        started = time.perf_counter()
+        old = read_legacy(ChunkSocket(stream), count)
+        old_time = time.perf_counter() - started
+        started = time.perf_counter()
+        new = read_buffered(ChunkSocket(stream), count)
+        new_time = time.perf_counter() - started
+        print(f'{size:>10}{old / count:>18,.0f}{new / count:>18,.0f}'
+              f'{old_time / count * 1000:>10.3f}{new_time / count * 1000:>10.3f}')
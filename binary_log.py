@@ -0,0 +1,263 @@
+""" Binary, columnar format for the game log and its reader. """
+import json
+import mmap
+import struct
+import sys
+from array import array
+from typing import Iterator, List, Tuple
+
+MAGIC = b'KLOG'
+# The magic of a log that is still written, or whose round was killed before close
+UNFINISHED = b'KLOW'
+VERSION = 2
+# magic, version, event count, offsets of: strings, record offsets, botname column, action column
+HEADER = struct.Struct('<4sB3xIQQQQ')
+RECORD_LENGTH = struct.Struct('<I')
+RECORD = struct.Struct('<IIB')
+STRING_LENGTH = struct.Struct('<I')
+STRING_ID = struct.Struct('<I')
+INTEGER = struct.Struct('<q')
+REAL = struct.Struct('<d')
+
+# How the response of a record is stored
+NONE, STRING, STRINGS, INTEGER_KIND, REAL_KIND, JSON_KIND = range(6)
+
+
+class BinaryLogWriter:
+    """
+    Writes the events of one round as length-prefixed records.
+    Botnames, actions, cards and other strings are stored once in a
+    dictionary per round and referenced by their id. At close the
+    dictionary, the record offsets and the botname and action columns
+    are appended and the header is patched to point at them; only then
+    the magic is set, so a log that wasn't closed can't be mistaken for one.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(UNFINISHED, VERSION, 0, 0, 0, 0, 0))
+        self._strings = {}
+        self._offsets = array('Q')
+        self._botnames = array('I')
+        self._actions = array('I')
+
+    def write(self, botname: str, action: str, response) -> None:
+        """
+        Append one event.
+        :param botname: the name of the bot or 'Game'
+        :param action: the action
+        :param response: None, a string, a list of strings, a number or anything json can encode
+        :return: None
+        """
+        botname_id = self._string_id(str(botname))
+        action_id = self._string_id(str(action))
+        if response is None:
+            payload = RECORD.pack(botname_id, action_id, NONE)
+        elif isinstance(response, str):
+            payload = RECORD.pack(botname_id, action_id, STRING) + STRING_ID.pack(self._string_id(response))
+        elif isinstance(response, bool):
+            payload = RECORD.pack(botname_id, action_id, JSON_KIND) + json.dumps(response).encode('utf-8')
+        elif isinstance(response, int):
+            payload = RECORD.pack(botname_id, action_id, INTEGER_KIND) + INTEGER.pack(response)
+        elif isinstance(response, float):
+            payload = RECORD.pack(botname_id, action_id, REAL_KIND) + REAL.pack(response)
+        elif isinstance(response, list) and all(isinstance(item, str) for item in response):
+            ids = array('I', [self._string_id(item) for item in response])
+            payload = RECORD.pack(botname_id, action_id, STRINGS) + ids.tobytes()
+        else:
+            payload = RECORD.pack(botname_id, action_id, JSON_KIND) + json.dumps(response).encode('utf-8')
+
+        self._offsets.append(self._file.tell())
+        self._botnames.append(botname_id)
+        self._actions.append(action_id)
+        self._file.write(RECORD_LENGTH.pack(len(payload)) + payload)
+
+    def flush(self) -> None:
+        """ flushes the records to the operating system """
+        self._file.flush()
+
+    def fileno(self) -> int:
+        """ returns the file descriptor """
+        return self._file.fileno()
+
+    def close(self) -> None:
+        """
+        Write the dictionary, the index and the header.
+        :return: None
+        """
+        strings_offset = self._file.tell()
+        self._file.write(STRING_ID.pack(len(self._strings)))
+        for text in self._strings:
+            encoded = text.encode('utf-8')
+            self._file.write(STRING_LENGTH.pack(len(encoded)) + encoded)
+        offsets_offset = self._file.tell()
+        self._file.write(self._offsets.tobytes())
+        botnames_offset = self._file.tell()
+        self._file.write(self._botnames.tobytes())
+        actions_offset = self._file.tell()
+        self._file.write(self._actions.tobytes())
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, len(self._offsets), strings_offset,
+                                     offsets_offset, botnames_offset, actions_offset))
+        self._file.close()
+
+    def _string_id(self, text: str) -> int:
+        """
+        The id of the string in the dictionary, adding it if it is new.
+        :param text: the string
+        :return: the id
+        """
+        string_id = self._strings.get(text)
+        if string_id is None:
+            string_id = self._strings[text] = len(self._strings)
+        return string_id
+
+
+class BinaryLogReader:
+    """
+    Reads a binary game log through a memory map.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as logfile:
+            if len(logfile.read(HEADER.size)) < HEADER.size:
+                raise ValueError(f'{path} is too short for a binary game log.')
+            self._map = mmap.mmap(logfile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, self._count, strings_offset, offsets_offset,
+             botnames_offset, actions_offset) = HEADER.unpack_from(self._map, 0)
+            if magic == UNFINISHED:
+                raise ValueError(f'{path} was not closed, its round was killed or is still running.')
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'{path} is not a binary game log of version {VERSION}.')
+            if actions_offset + self._count * array('I').itemsize > len(self._map):
+                raise ValueError(f'{path} is truncated.')
+            self._strings = self._read_strings(strings_offset)
+            self._offsets = self._column('Q', offsets_offset)
+            self._botnames = self._column('I', botnames_offset)
+            self._actions = self._column('I', actions_offset)
+        except struct.error as e:
+            self._map.close()
+            raise ValueError(f'{path} is truncated: {e}') from e
+        except ValueError:
+            self._map.close()
+            raise
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[Tuple[str, str, object]]:
+        """
+        Iterate over the events.
+        :return: iterator of (botname, action, response)
+        """
+        for number in range(self._count):
+            yield self[number]
+
+    def __getitem__(self, number: int) -> Tuple[str, str, object]:
+        """
+        Read one event through the index.
+        :param number: the number of the event
+        :return: (botname, action, response)
+        """
+        offset = self._offsets[number]
+        length = RECORD_LENGTH.unpack_from(self._map, offset)[0]
+        start = offset + RECORD_LENGTH.size
+        botname_id, action_id, kind = RECORD.unpack_from(self._map, start)
+        value = self._map[start + RECORD.size:start + length]
+        return self._strings[botname_id], self._strings[action_id], self._decode(kind, value)
+
+    def columns(self) -> dict:
+        """
+        Load the events as columns.
+        :return: dict with the string dictionary, the botname and action ids as arrays and the responses
+        """
+        return {
+            'strings': self._strings,
+            'botname': self._botnames,
+            'action': self._actions,
+            'response': [event[2] for event in self],
+        }
+
+    def close(self) -> None:
+        """ closes the memory map """
+        self._map.close()
+
+    def _decode(self, kind: int, value: bytes):
+        """
+        Decode the stored response.
+        :param kind: how the response is stored
+        :param value: the stored bytes
+        :return: the response
+        """
+        if kind == NONE:
+            return None
+        if kind == STRING:
+            return self._strings[STRING_ID.unpack(value)[0]]
+        if kind == STRINGS:
+            return [self._strings[string_id] for string_id in array('I', value)]
+        if kind == INTEGER_KIND:
+            return INTEGER.unpack(value)[0]
+        if kind == REAL_KIND:
+            return REAL.unpack(value)[0]
+        return json.loads(value)
+
+    def _read_strings(self, offset: int) -> List[str]:
+        """
+        Read the string dictionary.
+        :param offset: the offset of the dictionary
+        :return: the strings by id
+        """
+        count = STRING_ID.unpack_from(self._map, offset)[0]
+        offset += STRING_ID.size
+        strings = []
+        for _ in range(count):
+            length = STRING_LENGTH.unpack_from(self._map, offset)[0]
+            offset += STRING_LENGTH.size
+            strings.append(self._map[offset:offset + length].decode('utf-8'))
+            offset += length
+        return strings
+
+    def _column(self, typecode: str, offset: int) -> array:
+        """
+        Read a column of fixed size integers.
+        :param typecode: the array typecode
+        :param offset: the offset of the column
+        :return: the column
+        """
+        column = array(typecode)
+        column.frombytes(self._map[offset:offset + self._count * column.itemsize])
+        return column
+
+
+def convert_json_log(json_path: str, binary_path: str) -> int:
+    """
+    Convert a .json game log (one json object per line) to the binary format.
+    :param json_path: the .json log
+    :param binary_path: the binary log to write
+    :return: the number of events
+    """
+    writer = BinaryLogWriter(binary_path)
+    count = 0
+    with open(json_path) as logfile:
+        for line in logfile:
+            if line.strip():
+                entry = json.loads(line)
+                writer.write(entry['botname'], entry['action'], entry['response'])
+                count += 1
+    writer.close()
+    return count
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == 'convert':
+        for json_path in sys.argv[2:]:
+            binary_path = json_path.rsplit('.', 1)[0] + '.klog'
+            print(f'{json_path} -> {binary_path}: {convert_json_log(json_path, binary_path)} events')
+    elif len(sys.argv) > 2 and sys.argv[1] == 'dump':
+        reader = BinaryLogReader(sys.argv[2])
+        for botname, action, response in reader:
+            print(f'{botname} / {action} / {response}')
+        reader.close()
+    else:
+        print('usage: binary_log.py convert <file.json>... | dump <file.klog>')
@@ -0,0 +1,167 @@
+""" The compact binary wire protocol (version 2) between the arena and the bots. """
+import struct
+from dataclasses import dataclass
+from typing import Dict, List
+
+from game.cards import CARD_CODES, CARD_NAMES
+
+JSON_PROTOCOL = 'text/json'
+BINARY_PROTOCOL = 'kitten/2'
+
+# A json frame starts with the length of its json header, which never reaches 0xB200 bytes
+MAGIC = 0xB2
+# magic, action code, payload length
+HEADER = struct.Struct('>BBH')
+DECKSIZE = struct.Struct('>H')
+POSITION = struct.Struct('>H')
+INFORM = struct.Struct('>BBB')
+
+ACTIONS = ('START', 'DRAW', 'PLAY', 'DEFUSE', 'EXPLODE', 'FUTURE', 'INFORM', 'OVER', 'BATCH')
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+# The card code of 'NONE' and of INFORM events without a card
+NO_CARD = 0xFF
+
+
+@dataclass
+class Traffic:
+    messages: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+    def add(self, other: 'Traffic') -> None:
+        """ adds the counters of the other Traffic """
+        self.messages += other.messages
+        self.bytes_sent += other.bytes_sent
+        self.bytes_received += other.bytes_received
+
+
+def is_binary_frame(first_byte: int) -> bool:
+    """
+    tells a binary frame from a json frame by its first byte
+    :param first_byte: the first byte of the frame
+    :return: True for a binary frame
+    """
+    return first_byte == MAGIC
+
+
+def create_frame(action: str, payload: bytes = b'') -> bytes:
+    """
+    frames the payload: magic, action code, payload length, payload
+    :param action: the action name
+    :param payload: the payload
+    :return: bytes
+    """
+    return HEADER.pack(MAGIC, ACTION_CODES[action], len(payload)) + payload
+
+
+def read_header(header: bytes) -> [str, int]:
+    """
+    checks the frame header
+    :param header: the first HEADER.size bytes of the frame
+    :return: the action name and the payload length
+    """
+    magic, action_code, length = HEADER.unpack(header)
+    if magic != MAGIC or action_code >= len(ACTIONS):
+        raise ValueError(f'Invalid binary frame header {bytes(header)!r}.')
+    return ACTIONS[action_code], length
+
+
+def card_code(card) -> int:
+    """ returns the code of a card name, NO_CARD for 'NONE' and anything else """
+    return CARD_CODES.get(card, NO_CARD)
+
+
+def card_name(code: int) -> str:
+    """ returns the name of a card code, 'NONE' for NO_CARD """
+    return CARD_NAMES[code] if code < len(CARD_NAMES) else 'NONE'
+
+
+def encode_request(action: dict, bot_codes: Dict[str, int]) -> bytes:
+    """
+    encodes an arena request as a binary frame
+    :param action: the request content as sent with the json protocol
+    :param bot_codes: the index of each bot in the START bot list
+    :return: bytes
+    """
+    name = action['action']
+    if name == 'DRAW':
+        payload = bytes((CARD_CODES[action['card']],))
+    elif name == 'DEFUSE':
+        payload = DECKSIZE.pack(action['decksize'])
+    elif name == 'FUTURE':
+        payload = bytes(CARD_CODES[card] for card in action['cards'])
+    elif name == 'INFORM':
+        payload = INFORM.pack(bot_codes[action['botname']], ACTION_CODES[action['event']],
+                              card_code(action['data']))
+    elif name == 'OVER':
+        payload = bytes(bot_codes[botname] for botname in action['ranks'])
+    elif name == 'BATCH':
+        payload = b''.join(encode_request(message, bot_codes) for message in action['messages'])
+    elif name in ('PLAY', 'EXPLODE'):
+        payload = b''
+    else:
+        raise ValueError(f'{name} is not sent with the binary protocol.')
+    return create_frame(name, payload)
+
+
+def decode_request(action: str, payload: bytes, botnames: List[str]) -> dict:
+    """
+    decodes a binary request into the content a json request would have, for the bots
+    :param action: the action name from the header
+    :param payload: the payload
+    :param botnames: the bot list from the START request
+    :return: dict
+    """
+    request = {'action': action}
+    if action == 'DRAW':
+        request['card'] = CARD_NAMES[payload[0]]
+    elif action == 'DEFUSE':
+        request['decksize'] = DECKSIZE.unpack(payload)[0]
+    elif action == 'FUTURE':
+        request['cards'] = [CARD_NAMES[code] for code in payload]
+    elif action == 'INFORM':
+        bot_code, event_code, code = INFORM.unpack(payload)
+        request['botname'] = botnames[bot_code]
+        request['event'] = ACTIONS[event_code]
+        request['data'] = card_name(code) if ACTIONS[event_code] == 'PLAY' else ''
+    elif action == 'OVER':
+        request['ranks'] = [botnames[code] for code in payload]
+    elif action == 'BATCH':
+        request['messages'] = []
+        offset = 0
+        while offset < len(payload):
+            name, length = read_header(payload[offset:offset + HEADER.size])
+            offset += HEADER.size
+            request['messages'].append(decode_request(name, payload[offset:offset + length], botnames))
+            offset += length
+    return request
+
+
+def encode_response(action: str, response=None) -> bytes:
+    """
+    encodes the reply of a bot as a binary frame
+    :param action: the action of the request
+    :param response: the card name for PLAY, the position for DEFUSE
+    :return: bytes
+    """
+    if action == 'PLAY':
+        return create_frame(action, bytes((card_code(response),)))
+    if action == 'DEFUSE':
+        return create_frame(action, POSITION.pack(int(response)))
+    return create_frame(action)
+
+
+def decode_response(action: str, payload: bytes):
+    """
+    decodes the reply of a bot into the content a text/plain json frame would carry
+    :param action: the action name from the header
+    :param payload: the payload
+    :return: bytes for PLAY and DEFUSE, None otherwise
+    """
+    if action == 'PLAY' and len(payload) == 1:
+        return card_name(payload[0]).encode('utf-8')
+    if action == 'DEFUSE' and len(payload) == POSITION.size:
+        return str(POSITION.unpack(payload)[0]).encode('utf-8')
+    if action in ('PLAY', 'DEFUSE'):
+        raise ValueError(f'Invalid {action} payload {bytes(payload)!r}.')
+    return None
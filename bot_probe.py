@@ -0,0 +1,127 @@
+""" Checks that the bots are reachable before a round and admits the fast ones. """
+import asyncio
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence
+
+from clowder import BotHealth
+from settings import CLOWDER_RETRY_AFTER
+
+
+@dataclass
+class ProbeResult:
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+
+    @property
+    def reachable(self) -> bool:
+        """ returns True if at least one probe connected """
+        return bool(self.latencies)
+
+
+async def probe_bot(bot: dict, count: int, timeout: float) -> ProbeResult:
+    """
+    Open and close a TCP connection to the bot count times.
+    Nothing is sent, so the bot sees a connection closed before any request.
+    :param bot: dict with name, ip and port
+    :param count: the number of probes
+    :param timeout: seconds a connect may take
+    :return: ProbeResult with the connect latencies
+    """
+    result = ProbeResult(bot['name'])
+    for _ in range(count):
+        started = time.monotonic()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(bot['ip'], int(bot['port'])), timeout)
+        except (OSError, asyncio.TimeoutError):
+            result.errors += 1
+            continue
+        result.latencies.append(time.monotonic() - started)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+    return result
+
+
+async def probe_bots(bot_list: List[dict], count: int, timeout: float) -> Dict[str, ProbeResult]:
+    """
+    Probe all bots at once.
+    :param bot_list: the bots
+    :param count: the number of probes per bot
+    :param timeout: seconds a connect may take
+    :return: dict of bot name -> ProbeResult
+    """
+    results = await asyncio.gather(*(probe_bot(bot, count, timeout) for bot in bot_list))
+    return {result.name: result for result in results}
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """
+    The nearest-rank percentile.
+    :param values: the samples
+    :param fraction: 0.5 for the median, 0.99 for p99
+    :return: the percentile, nan without samples
+    """
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def admit_bots(
+        bot_list: List[dict],
+        probes: Dict[str, ProbeResult],
+        health: Dict[str, BotHealth],
+        max_p50: float,
+        max_p99: float,
+        retry_after: float = CLOWDER_RETRY_AFTER
+) -> List[dict]:
+    """
+    Keep the bots that accepted a probe and that answered fast enough in their last rounds.
+    A connect only shows that the bot's port is open, so the percentiles are taken over
+    the answer latencies recorded in health, timed out requests included. Bots without
+    a history are admitted. A slow bot sits out for retry_after seconds, then it gets
+    another round with a fresh history.
+    :param bot_list: the bots
+    :param probes: the ProbeResult per bot name
+    :param health: the BotHealth per bot name, slow_since and latencies are updated
+    :param max_p50: the highest median latency in seconds, 0 for no limit
+    :param max_p99: the highest p99 latency in seconds, 0 for no limit
+    :param retry_after: seconds a slow bot sits out
+    :return: the admitted bots
+    """
+    admitted = []
+    now = time.monotonic()
+    for bot in bot_list:
+        name = bot['name']
+        bot_health = health.get(name)
+        latencies = bot_health.latencies if bot_health is not None else ()
+        p50 = percentile(latencies, 0.5)
+        p99 = percentile(latencies, 0.99)
+        if not probes[name].reachable:
+            reason = 'unreachable'
+        elif max_p50 and p50 > max_p50:
+            reason = f'p50 above {max_p50 * 1000:.0f}ms'
+        elif max_p99 and p99 > max_p99:
+            reason = f'p99 above {max_p99 * 1000:.0f}ms'
+        else:
+            reason = None
+        if reason is not None and reason != 'unreachable':
+            if not bot_health.slow_since:
+                bot_health.slow_since = now
+            elif now - bot_health.slow_since >= retry_after:
+                print(f'Probe: {name} sat out {retry_after:.0f}s for answering slowly, trying it again')
+                bot_health.latencies.clear()
+                bot_health.slow_since = 0.0
+                reason = None
+        elif reason is None and bot_health is not None:
+            bot_health.slow_since = 0.0
+        if reason is None:
+            admitted.append(bot)
+        print(f'Probe: {name:<20} p50 {p50 * 1000:7.1f}ms  p99 {p99 * 1000:7.1f}ms  '
+              f'{"admitted" if reason is None else "dropped: " + reason}')
+    return admitted
@@ -0,0 +1,252 @@
+""" Provides the asyncio connection to a bot. """
+import asyncio
+import struct
+import time
+from dataclasses import dataclass
+from typing import Dict, List
+
+import binary_protocol
+from instrumentation import METRICS
+from binary_protocol import BINARY_PROTOCOL, JSON_PROTOCOL, Traffic
+from message import create_message, check_jsonheader, json_encode, json_decode
+
+
+@dataclass
+class BotReply:
+    response: object
+    latency: float = 0.0
+    timed_out: bool = False
+    # repr of the exception if the connection failed
+    error: str = None
+
+
+class BotStream:
+    """
+    Stream reader/writer for one bot speaking the framed protocol of message.Message.
+    The connection is kept open for the whole round; bots that close after
+    each reply fall back to one-shot mode.
+    A bot that accepts the binary protocol at START is sent binary frames
+    until the connection is closed; a new connection starts with json again.
+    With a budget, the time the bot takes to answer is taken from it like a
+    chess clock; once it is used up the bot isn't asked anymore.
+    """
+
+    def __init__(self, name: str, ipaddr: str, port, budget: float = None):
+        self._name = name
+        self._budget = budget
+        self._addr = (ipaddr, int(port))
+        self._reader = None
+        self._writer = None
+        self._exchanges = 0
+        self._one_shot = False
+        self._protocol = JSON_PROTOCOL
+        self._bot_codes = {}
+        self._failures = 0
+        self._latencies: List[float] = []
+        self._traffic = {JSON_PROTOCOL: Traffic(), BINARY_PROTOCOL: Traffic()}
+
+    async def request(self, action: dict, timeout: float) -> BotReply:
+        """
+        Send the action to the bot and wait for its response.
+        :param action: the request content
+        :param timeout: seconds to wait for the response, cut to the budget left
+        :return: BotReply with the response (None on error or timeout)
+        """
+        if self._budget is not None:
+            if self._budget <= 0:
+                return BotReply(None, timed_out=True)
+            timeout = min(timeout, self._budget)
+        started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(self._exchange(action), timeout)
+        except asyncio.TimeoutError:
+            print(f'Main: Timeout waiting for {self._name} on {action["action"]}')
+            # A late reply would be read as the answer to the next request
+            self._failures += 1
+            METRICS.count('timeouts', label=self._name)
+            await self.close()
+            latency = self._charge(started)
+            self._latencies.append(latency)
+            return BotReply(None, latency, timed_out=True)
+        except (OSError, EOFError, ValueError) as e:
+            print(f'Main: Error: Exception for {self._addr}: {e!r}')
+            self._failures += 1
+            METRICS.count('errors', label=self._name)
+            await self.close()
+            return BotReply(None, self._charge(started), error=repr(e))
+        latency = self._charge(started)
+        self._latencies.append(latency)
+        METRICS.observe(f'request.{action["action"]}', latency, self._name)
+        METRICS.observe('request', latency, self._name)
+        return BotReply(response, latency)
+
+    def _charge(self, started: float) -> float:
+        """
+        Take the time since started from the budget.
+        :param started: time.monotonic() when the request was sent
+        :return: the latency
+        """
+        latency = time.monotonic() - started
+        if self._budget is not None:
+            self._budget -= latency
+        return latency
+
+    def upgrade(self, botnames: List[str]) -> bool:
+        """
+        Switch the open connection to the binary protocol.
+        :param botnames: the bot list of the START request, the bot codes are the indices
+        :return: True if the connection was upgraded
+        """
+        if self._writer is None or self._one_shot:
+            return False
+        self._protocol = BINARY_PROTOCOL
+        self._bot_codes = {botname: code for code, botname in enumerate(botnames)}
+        return True
+
+    async def close(self) -> None:
+        """
+        Close the connection.
+        :return: None
+        """
+        writer = self._writer
+        self._reader = None
+        self._writer = None
+        self._protocol = JSON_PROTOCOL
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def _exchange(self, action: dict):
+        """
+        Send the request, reconnecting once if a reused connection was dropped.
+        :param action: the request content
+        :return: the response content
+        """
+        reused = self._writer is not None
+        if reused and self._reader.at_eof():
+            self._mark_one_shot()
+            await self.close()
+            reused = False
+        if self._writer is None:
+            await self._connect()
+        try:
+            return await self._send_receive(action)
+        except (OSError, EOFError):
+            if not reused:
+                raise
+            # The peer dropped a reused connection, retry on a fresh one
+            self._mark_one_shot()
+            await self.close()
+            await self._connect()
+            return await self._send_receive(action)
+
+    async def _connect(self) -> None:
+        """
+        Open a new connection to the bot.
+        :return: None
+        """
+        self._reader, self._writer = await asyncio.open_connection(*self._addr)
+        self._exchanges = 0
+
+    async def _send_receive(self, action: dict):
+        """
+        Write one framed request and read the framed response.
+        :param action: the request content
+        :return: the response content
+        """
+        if self._protocol == BINARY_PROTOCOL:
+            return await self._send_receive_binary(action)
+
+        message = create_message(
+            content_bytes=json_encode(action, 'utf-8'),
+            content_type='text/json',
+            content_encoding='utf-8',
+        )
+        self._writer.write(message)
+        await self._writer.drain()
+
+        reader = self._reader
+        hdrlen = struct.unpack('>H', await reader.readexactly(2))[0]
+        jsonheader = json_decode(await reader.readexactly(hdrlen), 'utf-8')
+        check_jsonheader(jsonheader)
+        data = await reader.readexactly(jsonheader['content-length'])
+        self._exchanges += 1
+        self._count(JSON_PROTOCOL, len(message), 2 + hdrlen + len(data))
+        if self._one_shot:
+            await self.close()
+
+        if jsonheader['content-type'] == 'text/json':
+            return json_decode(data, jsonheader['content-encoding'])
+        # Binary or unknown content-type
+        return data
+
+    async def _send_receive_binary(self, action: dict):
+        """
+        Write one binary request and read the binary response.
+        :param action: the request content
+        :return: the response content as a text/plain json frame would carry it
+        """
+        frame = binary_protocol.encode_request(action, self._bot_codes)
+        self._writer.write(frame)
+        await self._writer.drain()
+
+        reader = self._reader
+        name, length = binary_protocol.read_header(await reader.readexactly(binary_protocol.HEADER.size))
+        if name != action['action']:
+            raise ValueError(f'{self._name} answered {name} to {action["action"]}.')
+        payload = await reader.readexactly(length)
+        self._exchanges += 1
+        self._count(BINARY_PROTOCOL, len(frame), binary_protocol.HEADER.size + length)
+        return binary_protocol.decode_response(name, payload)
+
+    def _count(self, protocol: str, sent: int, received: int) -> None:
+        """
+        Add one exchange to the traffic of the protocol.
+        :return: None
+        """
+        traffic = self._traffic[protocol]
+        traffic.messages += 1
+        traffic.bytes_sent += sent
+        traffic.bytes_received += received
+
+    def _mark_one_shot(self) -> None:
+        """
+        Remember bots that close the connection after their first reply.
+        :return: None
+        """
+        if self._exchanges == 1 and not self._one_shot:
+            print(f'Main: {self._name} closes after each reply, using one-shot mode')
+            self._one_shot = True
+
+    @property
+    def name(self):
+        """ returns the name of the bot """
+        return self._name
+
+    @property
+    def budget(self):
+        """ returns the seconds left of the budget, None without a budget """
+        return self._budget
+
+    @property
+    def failures(self) -> int:
+        """ returns the number of requests that timed out or failed """
+        return self._failures
+
+    @property
+    def latencies(self) -> List[float]:
+        """ returns the seconds the bot took to answer each request, timed out ones included """
+        return self._latencies
+
+    @property
+    def protocol(self) -> str:
+        """ returns the protocol of the current connection """
+        return self._protocol
+
+    @property
+    def traffic(self) -> Dict[str, Traffic]:
+        """ returns the messages and bytes exchanged per protocol """
+        return self._traffic
@@ -1,3 +1,6 @@
+import selectors
+
+import instrumentation
 from message import Message, json_encode, json_decode
 
 
@@ -5,11 +8,32 @@ class ClientMessage(Message):
     """
     constructor for ClientMessage
     """
-    def __init__(self, selector, socket, ipaddr, request):
+    def __init__(self, selector, socket, ipaddr, request, keep_alive=False):
         super().__init__(selector, socket, ipaddr)
         self._request = request
         self._request_queued = False
         self._response = None
+        self._response_received = False
+        self._keep_alive = keep_alive
+        self._exchanges = 0
+
+    def reset(self, request):
+        """
+        prepares another request/response exchange on the open socket
+        :param request: the next request to send
+        :return: None
+        """
+        self._request = request
+        self._request_queued = False
+        self._response = None
+        self._response_received = False
+        self._jsonheader_len = None
+        self._jsonheader = None
+        self._selector.register(
+            self._socket,
+            selectors.EVENT_READ | selectors.EVENT_WRITE,
+            data=self
+        )
 
     def _process_read(self):
         """
@@ -19,17 +43,19 @@ class ClientMessage(Message):
         self._process_headers()
 
         if self._jsonheader:
-            if self._response is None:
+            if not self._response_received:
                 self.process_response()
 
     def _process_response_json_content(self):
         content = self._response
         # result = content.get('result')
-        print(f'Got result: {content}')
+        if instrumentation.VERBOSITY >= 2:
+            print(f'Got result: {content}')
 
     def _process_response_binary_content(self):
         content = self._response
-        print(f'Got response: {content!r}')
+        if instrumentation.VERBOSITY >= 2:
+            print(f'Got response: {content!r}')
 
     def _process_write(self):
         """
@@ -75,20 +101,41 @@ class ClientMessage(Message):
         content_len = self._jsonheader['content-length']
         if not len(self._recv_buffer) >= content_len:
             return
-        data = self._recv_buffer[:content_len]
-        self._recv_buffer = self._recv_buffer[content_len:]
+        data = self._recv_buffer.view(content_len)
+        self._recv_buffer.consume(content_len)
         if self._jsonheader['content-type'] == 'text/json':
             encoding = self._jsonheader['content-encoding']
             self._response = json_decode(data, encoding)
-            print(f'Received response {self.response!r} from {self._ipaddr}')
+            if instrumentation.VERBOSITY >= 2:
+                print(f'Received response {self.response!r} from {self._ipaddr}')
             self._process_response_json_content()
         else:
-            # Binary or unknown content-type
-            self._response = data
-            print(
-                f'Received {self._jsonheader["content-type"]} '
-                f'response from {self._ipaddr}'
-            )
+            # Binary or unknown content-type, the caller gets its own bytes
+            self._response = bytes(data)
+            self._recv_buffer.bytes_copied += content_len
+            if instrumentation.VERBOSITY >= 2:
+                print(
+                    f'Received {self._jsonheader["content-type"]} '
+                    f'response from {self._ipaddr}'
+                )
             self._process_response_binary_content()
-        # Close when response has been processed
-        self.close()
+        self._response_received = True
+        self._exchanges += 1
+        if self._keep_alive:
+            # Keep the socket open for the next exchange, but stop watching it
+            self._selector.unregister(self._socket)
+        else:
+            # Close when response has been processed
+            self.close()
+
+    @property
+    def socket(self):
+        return self._socket
+
+    @property
+    def response_received(self):
+        return self._response_received
+
+    @property
+    def exchanges(self):
+        return self._exchanges
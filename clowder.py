@@ -0,0 +1,204 @@
+""" Provides the cached bot registry of the clowder. """
+import ast
+import json
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from connection_pool import ConnectionPool
+from settings import CLOWDER_MAX_FAILURES, CLOWDER_RETRY_AFTER, CLOWDER_TIMEOUT, CLOWDER_TTL, PROBE_HISTORY
+
+
+@dataclass
+class BotHealth:
+    rounds: int = 0
+    failed_rounds: int = 0
+    consecutive_failures: int = 0
+    last_failure: float = 0.0
+    unreachable: int = 0
+    # The seconds the bot took to answer in its last rounds, timed out requests included
+    latencies: deque = field(default_factory=lambda: deque(maxlen=PROBE_HISTORY))
+    # When the bot was first left out for answering too slowly, 0.0 if it wasn't
+    slow_since: float = 0.0
+
+
+class ClowderRegistry:
+    """
+    Keeps the bot list of the clowder between rounds.
+    The list is queried again when it is older than ttl seconds, asking
+    only for the bots changed since the last version. A clowder that does
+    not know versions answers with the full list, which replaces the cache.
+    If the clowder does not answer in time the cached list is used.
+    Bots that failed max_failures rounds in a row are left out until
+    retry_after seconds have passed since their last failure.
+    """
+
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            ttl: float = CLOWDER_TTL,
+            timeout: float = CLOWDER_TIMEOUT,
+            max_failures: int = CLOWDER_MAX_FAILURES,
+            retry_after: float = CLOWDER_RETRY_AFTER
+    ):
+        self._addr = (host, int(port))
+        self._ttl = ttl
+        self._timeout = timeout
+        self._max_failures = max_failures
+        self._retry_after = retry_after
+        self._bots = {}
+        self._version = None
+        self._fetched = None
+        self._health = {}
+        self._connections = None
+
+    def bots(self) -> List[dict]:
+        """
+        The registered bots that are healthy enough to play.
+        :return: list of bot dicts with name, ip and port
+        """
+        if self._fetched is None or time.monotonic() - self._fetched >= self._ttl:
+            self.refresh()
+        now = time.monotonic()
+        return [
+            bot for name, bot in self._bots.items()
+            if not self._is_benched(self._health.get(name), now)
+        ]
+
+    def refresh(self) -> bool:
+        """
+        Query the bots changed since the cached version.
+        :return: True if the clowder answered
+        """
+        action = {'action': 'QUERY', 'type': 'bot', 'since': self._version}
+        request = dict(type='text/json', encoding='utf-8', content=action)
+        try:
+            message = self._get_connections().send(*self._addr, request, timeout=self._timeout)
+            response = message.response if message.response_received else None
+        except OSError as e:
+            print(f'Clowder: Error: {e!r}')
+            response = None
+        if response is None:
+            if self._fetched is not None:
+                print(f'Clowder: no answer, using the cached list of {len(self._bots)} bots')
+                # Don't ask again before the next ttl
+                self._fetched = time.monotonic()
+            return False
+
+        try:
+            self._apply(response)
+        except (ValueError, SyntaxError, TypeError, KeyError) as e:
+            print(f'Clowder: Error: invalid bot list {response!r}: {e!r}')
+            return False
+        self._fetched = time.monotonic()
+        return True
+
+    def record_round(self, failures: Dict[str, int], latencies: Dict[str, List[float]] = None) -> None:
+        """
+        Update the health of the bots that played a round.
+        :param failures: the number of timeouts and errors per bot name, for every bot of the round
+        :param latencies: the answer latencies per bot name
+        :return: None
+        """
+        now = time.monotonic()
+        for name, count in failures.items():
+            health = self._health.setdefault(name, BotHealth())
+            health.rounds += 1
+            health.latencies.extend((latencies or {}).get(name, ()))
+            if count:
+                health.failed_rounds += 1
+                health.consecutive_failures += 1
+                health.last_failure = now
+                if health.consecutive_failures == self._max_failures:
+                    print(f'Clowder: {name} failed {health.consecutive_failures} rounds in a row, '
+                          f'leaving it out for {self._retry_after:.0f}s')
+            else:
+                health.consecutive_failures = 0
+
+    def record_probe(self, name: str, reachable: bool) -> None:
+        """
+        Count the pre-round probes a bot didn't accept.
+        :param name: the name of the bot
+        :param reachable: False if no probe connected
+        :return: None
+        """
+        health = self._health.setdefault(name, BotHealth())
+        if not reachable:
+            health.unreachable += 1
+
+    def close(self) -> None:
+        """
+        Close the connection to the clowder.
+        :return: None
+        """
+        if self._connections is not None:
+            self._connections.close()
+            self._connections = None
+
+    def _apply(self, response) -> None:
+        """
+        Apply a full list or a delta to the cache.
+        :param response: the QUERY response
+        :return: None
+        """
+        if not isinstance(response, dict):
+            # A clowder without versions: the full list
+            self._bots = {bot['name']: bot for bot in parse_bot_list(response)}
+            self._version = None
+            return
+        if 'bots' in response:
+            self._bots = {bot['name']: bot for bot in parse_bot_list(response['bots'])}
+        else:
+            for bot in parse_bot_list(response.get('changed', [])):
+                self._bots[bot['name']] = bot
+            for name in response.get('removed', []):
+                self._bots.pop(name, None)
+        self._version = response.get('version')
+
+    def _is_benched(self, health: BotHealth, now: float) -> bool:
+        """
+        Check if a bot is left out because of its failures.
+        :param health: the health of the bot or None
+        :param now: time.monotonic()
+        :return: True if the bot doesn't play
+        """
+        return (health is not None
+                and health.consecutive_failures >= self._max_failures
+                and now - health.last_failure < self._retry_after)
+
+    def _get_connections(self) -> ConnectionPool:
+        """
+        Get the connection pool to the clowder
+        :return: ConnectionPool
+        """
+        if self._connections is None:
+            self._connections = ConnectionPool()
+        return self._connections
+
+    @property
+    def health(self) -> Dict[str, BotHealth]:
+        """ returns the health per bot name """
+        return self._health
+
+    @property
+    def version(self):
+        """ returns the version of the cached list, None for a clowder without versions """
+        return self._version
+
+
+def parse_bot_list(content) -> List[dict]:
+    """
+    Read the bot list of a QUERY response.
+    :param content: a list, a json string or the python representation a clowder without versions sends
+    :return: list of bot dicts
+    """
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except ValueError:
+            content = ast.literal_eval(content)
+    if not isinstance(content, list):
+        raise TypeError(f'Expected a list of bots, got {type(content).__name__}.')
+    return content
@@ -0,0 +1,145 @@
+""" A local stand-in for the clowder, the registry the bots sign up at. """
+import asyncio
+import json
+import struct
+import sys
+from typing import Dict, List
+
+from message import check_jsonheader, create_message, json_decode, json_encode
+
+
+class ClowderServer:
+    """
+    Keeps the registered bots with a version that grows with every change.
+    QUERY with 'since' answers with the bots changed and removed after that
+    version, or with the full list for 'since' None. QUERY without 'since'
+    answers like the original clowder, with the list as a python string.
+    """
+
+    def __init__(self, bots: List[dict] = ()):
+        self._version = 0
+        # name -> (version of the last change, bot or None once removed)
+        self._changes: Dict[str, tuple] = {}
+        for bot in bots:
+            self.register(bot)
+
+    def register(self, bot: dict) -> int:
+        """
+        Add or update a bot.
+        :param bot: dict with name, ip, port and optional capabilities
+        :return: the new version
+        """
+        self._version += 1
+        self._changes[bot['name']] = (self._version, dict(bot))
+        return self._version
+
+    def unregister(self, name: str) -> int:
+        """
+        Remove a bot.
+        :param name: the name of the bot
+        :return: the new version
+        """
+        if name in self._changes and self._changes[name][1] is not None:
+            self._version += 1
+            self._changes[name] = (self._version, None)
+        return self._version
+
+    def query(self, since=None) -> dict:
+        """
+        The bots changed since a version.
+        :param since: the version the client has, None for the full list
+        :return: dict with version and bots, or version, changed and removed
+        """
+        if since is None or since > self._version:
+            return {'version': self._version, 'bots': self.bots}
+        changed = []
+        removed = []
+        for name, (version, bot) in self._changes.items():
+            if version > since:
+                if bot is None:
+                    removed.append(name)
+                else:
+                    changed.append(bot)
+        return {'version': self._version, 'changed': changed, 'removed': removed}
+
+    def handle(self, request: dict):
+        """
+        Answer one request.
+        :param request: the request content
+        :return: the response content
+        """
+        action = request.get('action')
+        if action == 'QUERY':
+            if 'since' in request:
+                return self.query(request['since'])
+            return str(self.bots)
+        if action == 'REGISTER':
+            bot = {key: request[key] for key in ('name', 'ip', 'port', 'capabilities') if key in request}
+            return {'version': self.register(bot)}
+        if action == 'UNREGISTER':
+            return {'version': self.unregister(request['name'])}
+        return {'error': f'unknown action {action!r}'}
+
+    async def serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Answer the framed requests of one connection until the client closes it.
+        :return: None
+        """
+        try:
+            while True:
+                try:
+                    hdrlen = struct.unpack('>H', await reader.readexactly(2))[0]
+                except asyncio.IncompleteReadError:
+                    break
+                jsonheader = json_decode(await reader.readexactly(hdrlen), 'utf-8')
+                check_jsonheader(jsonheader)
+                data = await reader.readexactly(jsonheader['content-length'])
+                request = json_decode(data, jsonheader['content-encoding'])
+                writer.write(create_message(
+                    content_bytes=json_encode(self.handle(request), 'utf-8'),
+                    content_type='text/json',
+                    content_encoding='utf-8',
+                ))
+                await writer.drain()
+        except (OSError, ValueError) as e:
+            print(f'Clowder: Error: {e!r}')
+        finally:
+            writer.close()
+
+    @property
+    def bots(self) -> List[dict]:
+        """ returns the registered bots """
+        return [bot for _, bot in self._changes.values() if bot is not None]
+
+    @property
+    def version(self) -> int:
+        """ returns the current version """
+        return self._version
+
+
+async def serve(host: str, port: int, bots: List[dict]) -> None:
+    """
+    Run the stand-in clowder until it is interrupted.
+    :param host: the address to listen on
+    :param port: the port to listen on
+    :param bots: the bots registered at start
+    :return: None
+    """
+    clowder = ClowderServer(bots)
+    server = await asyncio.start_server(clowder.serve_client, host, port)
+    print(f'Clowder: listening on {host}:{port} with {len(clowder.bots)} bots')
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    # usage: clowder_server.py [port] [bots.json]
+    listen_port = int(sys.argv[1]) if len(sys.argv) > 1 else 65432
+    bot_list = []
+    if len(sys.argv) > 2:
+        with open(sys.argv[2]) as botfile:
+            bot_list = json.load(botfile)
+    try:
+        asyncio.run(serve('127.0.0.1', listen_port, bot_list))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,160 @@
+""" Provides long-lived connections to the bots. """
+import selectors
+import socket
+import time
+import traceback
+
+from client_message import ClientMessage
+
+
+class ConnectionPool:
+    """
+    Keeps one framed connection per (ip, port) open for the whole round.
+    Bots that close the socket after each reply fall back to one-shot mode.
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._connections = {}
+        self._one_shot = set()
+
+    def send(self, ipaddr, port, request, timeout=60):
+        """
+        Send a request and wait for the response.
+        :param ipaddr: the ip address of the server
+        :param port: the port of the server
+        :param request: dict with type, encoding and content
+        :param timeout: seconds to wait for the response
+        :return: the ClientMessage holding the response
+        """
+        addr = (ipaddr, int(port))
+        return self._exchange({addr: request}, time.monotonic() + timeout)[addr]
+
+    def close(self) -> None:
+        """
+        Close all open connections.
+        :return: None
+        """
+        for message in self._connections.values():
+            if message.socket is not None:
+                message.close()
+        self._connections.clear()
+        self._selector.close()
+
+    def _exchange(self, requests, deadline):
+        """
+        Run the request/response exchanges until all are done or the deadline passed.
+        :param requests: dict of (ip, port) -> request
+        :param deadline: time.monotonic() value to give up at
+        :return: dict of (ip, port) -> ClientMessage
+        """
+        active = {}
+        for addr, request in requests.items():
+            active[addr] = self._acquire(addr, request)
+        retried = set()
+
+        while True:
+            now = time.monotonic()
+            pending = [
+                message for message in active.values()
+                if message.socket is not None and not message.response_received
+            ]
+            if not pending:
+                break
+            if now >= deadline:
+                for message in pending:
+                    print(f'Main: Timeout waiting for {message.ipaddr}')
+                    self._discard(message)
+                break
+            for key, mask in self._selector.select(timeout=deadline - now):
+                message = key.data
+                try:
+                    message.process_events(mask)
+                except Exception:
+                    addr = message.ipaddr
+                    if message.exchanges and addr not in retried:
+                        # The peer dropped a reused connection, retry on a fresh one
+                        retried.add(addr)
+                        self._mark_one_shot(message)
+                        self._discard(message)
+                        active[addr] = self._acquire(addr, requests[addr])
+                    else:
+                        print(
+                            f'Main: Error: Exception for {message.ipaddr}:\n'
+                            f'{traceback.format_exc()}'
+                        )
+                        self._discard(message)
+
+        return active
+
+    def _acquire(self, addr, request):
+        """
+        Reuse the open connection for addr or open a new one.
+        :param addr: (ip, port)
+        :param request: the request to send
+        :return: ClientMessage ready to send the request
+        """
+        message = self._connections.get(addr)
+        if message is not None:
+            if self._is_stale(message):
+                self._mark_one_shot(message)
+                self._discard(message)
+            else:
+                message.reset(request)
+                return message
+        return self._connect(addr, request)
+
+    def _connect(self, addr, request):
+        """
+        Open a new connection to addr.
+        :param addr: (ip, port)
+        :param request: the request to send
+        :return: ClientMessage registered with the selector
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        sock.connect_ex(addr)
+        keep_alive = addr not in self._one_shot
+        message = ClientMessage(self._selector, sock, addr, request, keep_alive)
+        self._selector.register(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, data=message)
+        if keep_alive:
+            self._connections[addr] = message
+        return message
+
+    def _discard(self, message) -> None:
+        """
+        Close the connection and forget it.
+        :param message: the ClientMessage to discard
+        :return: None
+        """
+        if self._connections.get(message.ipaddr) is message:
+            del self._connections[message.ipaddr]
+        if message.socket is not None:
+            message.close()
+
+    def _mark_one_shot(self, message) -> None:
+        """
+        Remember bots that close the connection after their first reply.
+        :param message: the ClientMessage whose peer closed the connection
+        :return: None
+        """
+        if message.exchanges == 1:
+            print(f'Main: {message.ipaddr} closes after each reply, using one-shot mode')
+            self._one_shot.add(message.ipaddr)
+
+    @staticmethod
+    def _is_stale(message) -> bool:
+        """
+        Check if the peer has closed the idle connection.
+        :param message: the idle ClientMessage
+        :return: True if the connection can't be reused
+        """
+        try:
+            message.socket.recv(1, socket.MSG_PEEK)
+        except BlockingIOError:
+            # Nothing to read, the connection is still open
+            return False
+        except OSError:
+            return True
+        # Either the peer closed (b'') or sent bytes nobody asked for
+        return True
@@ -1,26 +1,39 @@
 """ Provides the game arena and the game itself. """
 import random
-from typing import List
+from collections import deque
+from typing import Dict, List
 
 from game.bot import Bot
-from game.cards import CardCounts, CardType, Card
+from game.cards import CARD_CODES, CARD_NAMES, Card, CardCounts, Hand
+from game.deck import Deck
+
+# The reasons an exploded bot went out, as logged with EXPLODE
+OUT_OF_DEFUSES = 'The bot was out of DEFUSE cards.'
+CARD_NOT_IN_HAND = 'The card chosen was not in the hand.'
 
 
 class Arena:
     """
     The game arena manages the game itself and the bots in the game.
+    All shuffling and kitten positions come from rng, so a random.Random
+    with a known seed deals the same round again.
     """
 
-    def __init__(self):
+    def __init__(self, verbose: bool = True, rng=None):
+        self._verbose = verbose
+        self._rng = rng if rng is not None else random
         self._cardcounts = None
         self._bots_alive = []
         self._ranking = []
         self._deck = None
         self._active_bot = None
-        self._queue = ['PLAY']
+        self._queue = deque(['PLAY'])
         self._state = ''
         self._exploded_bots_log = {}
+        self._disqualified = []
         self._bot_points = {}
+        self._next_alive = []
+        self._previous_alive = []
 
     def start_round(self, bot_count: int) -> CardCounts:
         """
@@ -30,8 +43,24 @@ class Arena:
         """
         for i in range(bot_count):
             bot = Bot()
+            bot.hand = Hand()
             self._bots_alive.append(bot)
-        self._cardcounts = CardCounts(
+        self._next_alive = [(i + 1) % bot_count for i in range(bot_count)]
+        self._previous_alive = [(i - 1) % bot_count for i in range(bot_count)]
+        self._cardcounts = self.card_counts(bot_count)
+        self.initialize_deck()
+
+        self._active_bot = 0
+        return self._cardcounts
+
+    @staticmethod
+    def card_counts(bot_count: int) -> CardCounts:
+        """
+        The number of cards of each type for a round.
+        :param bot_count: the number of bots
+        :return: the card counts
+        """
+        return CardCounts(
             EXPLODING_KITTEN=bot_count - 1,
             DEFUSE=2,
             SKIP=bot_count + 6,
@@ -39,28 +68,24 @@ class Arena:
             NORMAL=bot_count * 5,
             SHUFFLE=bot_count + 1
         )
-        self.initialize_deck()
-
-        self._active_bot = 0
-        return self._cardcounts
 
     def initialize_deck(self) -> None:
         """
         Initializes the deck with the given card counts
         :return: None
         """
-        self._deck = []
-        for card_type in CardType:
-            if card_type == CardType.EXPLODING_KITTEN:
+        cards = bytearray()
+        for card in Card:
+            if card == Card.EXPLODING_KITTEN:
                 continue
-            count = getattr(self._cardcounts, card_type.name)
-            self._deck.extend([Card(card_type) for _ in range(count)])
-        random.shuffle(self._deck)
+            cards.extend([card] * getattr(self._cardcounts, card.name))
+        self._deck = Deck(cards)
+        self._deck.shuffle(self._rng)
 
         self.initialize_bot_hands()
 
         for _ in range(self._cardcounts.EXPLODING_KITTEN):
-            self._deck.insert(random.randint(0, len(self._deck)), Card(CardType.EXPLODING_KITTEN))
+            self._deck.insert(self._rng.randint(0, len(self._deck)), Card.EXPLODING_KITTEN)
 
     def initialize_bot_hands(self) -> None:
         """
@@ -68,11 +93,10 @@ class Arena:
         :return: None
         """
         for bot in self._bots_alive:
-            bot.hand.append(Card(CardType.DEFUSE))
+            bot.hand.add(Card.DEFUSE)
         for i in range(7):
             for bot in self._bots_alive:
-                card = self._deck.pop()
-                bot.hand.append(card)
+                bot.hand.add(self._deck.pop())
 
     def take_turn(self) -> [int, str]:
         """
@@ -82,7 +106,7 @@ class Arena:
         - the action the bot has to take
         - the data to send to the bot
         """
-        self._state = self._queue.pop(0)
+        self._state = self._queue.popleft()
         if self._state in ['PLAY']:
             return self._active_bot, self._state, None
         elif self._state == 'NEXTBOT':
@@ -91,14 +115,14 @@ class Arena:
             return self._active_bot, self._state, None
         elif self._state == 'DRAW':
             card = self._deck.pop()
-            cardname = card.card_type.name
-            if cardname == 'EXPLODING_KITTEN':
-                if Card(CardType.DEFUSE) in self._bots_alive[self._active_bot].hand:
+            cardname = CARD_NAMES[card]
+            if card == Card.EXPLODING_KITTEN:
+                if Card.DEFUSE in self._bots_alive[self._active_bot].hand:
                     self._queue.append('DEFUSE')
                 else:
-                    self._explode_bot(bot=self._active_bot, reason="The bot was out of DEFUSE cards.", disqualified=False)
+                    self._explode_bot(bot=self._active_bot, reason=OUT_OF_DEFUSES, disqualified=False)
             else:
-                self._bots_alive[self._active_bot].hand.append(card)
+                self._bots_alive[self._active_bot].hand.add(card)
                 self._queue.append('NEXTBOT')
             return self._active_bot, self._state, cardname
         elif self._state == 'DEFUSE':
@@ -107,13 +131,14 @@ class Arena:
             return self._active_bot, self._state, None
         elif self._state == 'EXPLODE':
             self._bots_alive[self._active_bot].alive = False
+            self._unlink_bot(self._active_bot)
             self._queue.append('NEXTBOT')
             explosion_reason = self._exploded_bots_log[self._active_bot]
             return self._active_bot, self._state, explosion_reason
         elif self._state == 'FUTURE':
             top_three = []
             for i in range(min(3, self.deck_size)):
-                top_three.append(self._deck[i].card_type.name)
+                top_three.append(CARD_NAMES[self._deck[i]])
             self._queue.append('PLAY')
             return self._active_bot, self._state, top_three
 
@@ -132,7 +157,7 @@ class Arena:
                 if response == 'SEE_THE_FUTURE':
                     self._queue.append('FUTURE')
                 elif response == 'SHUFFLE':
-                    random.shuffle(self._deck)
+                    self._deck.shuffle(self._rng)
                     self._queue.append('PLAY')
                 elif response == 'SKIP':
                     self._queue.append('NEXTBOT')
@@ -140,7 +165,7 @@ class Arena:
                     self._queue.append('PLAY')
                 return True
             else:
-                self._explode_bot(bot=self._active_bot, reason="The card chosen was not in the hand.", disqualified=True)
+                self._explode_bot(bot=self._active_bot, reason=CARD_NOT_IN_HAND, disqualified=True)
                 return False
         elif self._state == 'DEFUSE':
             try:
@@ -148,11 +173,13 @@ class Arena:
             except ValueError:
                 position = -1
             if 0 <= position < len(self._deck):
-                self._deck.insert(position, Card(CardType.EXPLODING_KITTEN))
-                print (f'Added Exploding Kitten at position {position}')
+                self._deck.insert(position, Card.EXPLODING_KITTEN)
+                if self._verbose:
+                    print (f'Added Exploding Kitten at position {position}')
             else:
-                self._deck.append(Card(CardType.EXPLODING_KITTEN))
-                print (f'Added Exploding Kitten at the end')
+                self._deck.append(Card.EXPLODING_KITTEN)
+                if self._verbose:
+                    print (f'Added Exploding Kitten at the end')
         elif self._state == 'NEXTBOT':
             return False
         return True
@@ -169,6 +196,7 @@ class Arena:
         self._ranking.append(bot)
         self._exploded_bots_log[bot] = reason
         if disqualified:
+            self._disqualified.append(bot)
             self._bot_points[bot] = 0
         else:
             self._bot_points[bot] = sum(self._ranking)
@@ -180,12 +208,7 @@ class Arena:
         :return: the hand of the bot
         """
         bot = self._bots_alive[active_bot]
-        hand = []
-        for i in range(len(bot.hand)):
-            card = bot.hand[i]
-            hand.append(card.card_type.name)
-
-        return hand
+        return [CARD_NAMES[card] for card in bot.hand]
 
     def _has_card(self, bot: Bot, cardname) -> bool:
         """
@@ -193,9 +216,8 @@ class Arena:
         :param cardname: the name of the card
         :return: True if the play is legal, False otherwise
         """
-        if cardname in bot.hand:
-            return True
-        return False
+        card = CARD_CODES.get(cardname)
+        return card is not None and card in bot.hand
 
     def _remove_card(self, cardname) -> None:
         """
@@ -204,20 +226,26 @@ class Arena:
         :return: None
         """
         bot = self._bots_alive[self._active_bot]
-        for i in range(len(bot.hand)):
-            if bot.hand[i].card_type.name == cardname:
-                bot.hand.pop(i)
-                break
+        bot.hand.remove(CARD_CODES[cardname])
 
     def _next_bot(self) -> int:
         """
         Move to the next bot.
         :return:
         """
-        next_bot = (self._active_bot + 1) % len(self._bots_alive)
-        while not self._bots_alive[next_bot].alive:
-            next_bot = (next_bot + 1) % len(self._bots_alive)
-        return next_bot
+        return self._next_alive[self._active_bot]
+
+    def _unlink_bot(self, bot: int) -> None:
+        """
+        Take the bot out of the ring of alive bots.
+        Its own link is kept, so the turn can still move on from it.
+        :param bot: the index of the bot
+        :return: None
+        """
+        next_bot = self._next_alive[bot]
+        previous_bot = self._previous_alive[bot]
+        self._next_alive[previous_bot] = next_bot
+        self._previous_alive[next_bot] = previous_bot
 
     @property
     def deck_size(self):
@@ -240,6 +268,16 @@ class Arena:
             bot_rank.append(bot_number)
         return bot_rank
     
+    @property
+    def disqualified(self) -> List[int]:
+        """ returns the bots disqualified for playing a card they don't have """
+        return self._disqualified
+
+    @property
+    def explosion_reasons(self) -> Dict[int, str]:
+        """ returns why each exploded bot exploded """
+        return self._exploded_bots_log
+
     @property
     def bot_ranking_points(self) -> dict:
         """ returns the bot ranking points """
@@ -0,0 +1,285 @@
+""" Simulates thousands of games at once on NumPy arrays. """
+import argparse
+import math
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError('game.batch needs numpy: pip install numpy') from e
+
+from game.arena import Arena
+from game.cards import CARD_CODES, CARD_NAMES, Card
+from game.simulation import PolicyBot, play_game
+
+KITTEN = Card.EXPLODING_KITTEN
+DEFUSE = Card.DEFUSE
+SKIP = Card.SKIP
+SEE_THE_FUTURE = Card.SEE_THE_FUTURE
+SHUFFLE = Card.SHUFFLE
+NORMAL = Card.NORMAL
+# A table policy plays the first of these cards it has and wants to play
+PLAY_ORDER = [SKIP, SHUFFLE, SEE_THE_FUTURE, NORMAL]
+
+PLAY, DRAW, DEFUSE_STATE, EXPLODE, NEXTBOT, FUTURE = range(6)
+DEFUSE_MODES = ['random', 'top', 'bottom']
+# Arena and batch statistics further apart than this many standard errors disagree
+MAX_Z = 4.0
+
+
+class TablePolicy:
+    """
+    A bot policy given as tables, so it can be applied to all games at once.
+    On PLAY the bot goes through PLAY_ORDER and plays a card it holds
+    with the probability from play_probs; on DEFUSE it puts the kitten
+    at a random position, on top or at the bottom of the deck.
+    """
+
+    def __init__(self, play_probs: Dict[str, float], defuse: str = 'random'):
+        self.play_probs = np.zeros(len(CARD_NAMES))
+        for name, probability in play_probs.items():
+            self.play_probs[CARD_CODES[name]] = probability
+        self.defuse = DEFUSE_MODES.index(defuse)
+
+
+TABLE_POLICIES = {
+    'passive': TablePolicy({}),
+    'random': TablePolicy({'SKIP': 0.5, 'SHUFFLE': 0.5, 'SEE_THE_FUTURE': 0.5, 'NORMAL': 0.5}),
+    'skipper': TablePolicy({'SKIP': 1.0, 'SHUFFLE': 0.3}, defuse='top'),
+    'hoarder': TablePolicy({'NORMAL': 1.0, 'SEE_THE_FUTURE': 1.0}, defuse='bottom'),
+}
+
+
+class TableBot(PolicyBot):
+    """ Plays a TablePolicy one game at a time, for the game.arena.Arena. """
+
+    def __init__(self, name: str, policy: TablePolicy):
+        super().__init__(name)
+        self._policy = policy
+
+    def choose_card(self) -> str:
+        for code in PLAY_ORDER:
+            name = CARD_NAMES[code]
+            if name in self.hand and random.random() < self._policy.play_probs[code]:
+                return name
+        return 'NONE'
+
+    def choose_position(self, decksize: int) -> int:
+        if self._policy.defuse == DEFUSE_MODES.index('top'):
+            return decksize
+        if self._policy.defuse == DEFUSE_MODES.index('bottom'):
+            return 0
+        return random.randint(0, decksize)
+
+
+@dataclass
+class BatchResult:
+    points: np.ndarray
+    winners: np.ndarray
+    turns: np.ndarray
+
+
+def simulate_batch(policies: List[TablePolicy], games: int, seed: int = None) -> BatchResult:
+    """
+    Play the games at once, with the bots always in the same seats.
+    The state machine is the one of Arena.take_turn and Arena.analyze_turn,
+    every game makes one step per loop.
+    :param policies: one TablePolicy per seat
+    :param games: the number of games
+    :param seed: the seed for the random generator
+    :return: BatchResult with the points (games x seats), winning seats and turns per game
+    """
+    rng = np.random.default_rng(seed)
+    bot_count = len(policies)
+    card_counts = Arena.card_counts(bot_count)
+    every_game = np.arange(games)
+
+    # The deck without kittens, shuffled per game; the top of the deck is the last card
+    base = np.concatenate([
+        np.full(getattr(card_counts, name), code, dtype=np.int8)
+        for code, name in enumerate(CARD_NAMES) if code != KITTEN
+    ])
+    deck = base[np.argsort(rng.random((games, len(base))), axis=1)]
+
+    # Each bot gets a DEFUSE, then seven cards are dealt from the top
+    hands = np.zeros((games, bot_count, len(CARD_NAMES)), dtype=np.int16)
+    hands[:, :, DEFUSE] = 1
+    for dealt in range(7 * bot_count):
+        hands[every_game, dealt % bot_count, deck[:, len(base) - 1 - dealt]] += 1
+    remaining = len(base) - 7 * bot_count
+
+    # Inserting the kittens one by one at random positions puts them
+    # into a uniformly random set of slots
+    kittens = card_counts.EXPLODING_KITTEN
+    size = remaining + kittens
+    slots = np.argsort(rng.random((games, size)), axis=1)[:, :kittens]
+    is_kitten = np.zeros((games, size), dtype=bool)
+    np.put_along_axis(is_kitten, slots, True, axis=1)
+    source = np.clip(np.cumsum(~is_kitten, axis=1) - 1, 0, remaining - 1)
+    deck = np.where(is_kitten, KITTEN, np.take_along_axis(deck[:, :remaining], source, axis=1)).astype(np.int8)
+    columns = np.arange(size)
+
+    length = np.full(games, size)
+    alive = np.ones((games, bot_count), dtype=bool)
+    alive_count = np.full(games, bot_count)
+    active = np.zeros(games, dtype=np.int64)
+    state = np.full(games, PLAY)
+    running = np.ones(games, dtype=bool)
+    exploded_sum = np.zeros(games, dtype=np.int64)
+    points = np.zeros((games, bot_count), dtype=np.int64)
+    turns = np.zeros(games, dtype=np.int64)
+    play_probs = np.array([policy.play_probs for policy in policies])
+    defuse_modes = np.array([policy.defuse for policy in policies])
+
+    while running.any():
+        turns[running] += 1
+        current = np.where(running, state, -1)
+
+        playing = np.flatnonzero(current == PLAY)
+        if playing.size:
+            bot = active[playing]
+            wants = (hands[playing, bot] > 0) & (rng.random((playing.size, len(CARD_NAMES))) < play_probs[bot])
+            choice = np.full(playing.size, -1)
+            for code in reversed(PLAY_ORDER):
+                choice = np.where(wants[:, code], code, choice)
+            state[playing[choice < 0]] = DRAW
+            played = playing[choice >= 0]
+            card = choice[choice >= 0]
+            hands[played, active[played], card] -= 1
+            state[played] = PLAY
+            state[played[card == SEE_THE_FUTURE]] = FUTURE
+            state[played[card == SKIP]] = NEXTBOT
+            shuffled = played[card == SHUFFLE]
+            if shuffled.size:
+                keys = rng.random((shuffled.size, size))
+                keys[columns >= length[shuffled, None]] = 2.0
+                deck[shuffled] = np.take_along_axis(deck[shuffled], np.argsort(keys, axis=1), axis=1)
+
+        drawing = np.flatnonzero(current == DRAW)
+        if drawing.size:
+            length[drawing] -= 1
+            card = deck[drawing, length[drawing]]
+            safe = drawing[card != KITTEN]
+            hands[safe, active[safe], card[card != KITTEN]] += 1
+            state[safe] = NEXTBOT
+            found = drawing[card == KITTEN]
+            can_defuse = hands[found, active[found], DEFUSE] > 0
+            state[found[can_defuse]] = DEFUSE_STATE
+            boom = found[~can_defuse]
+            exploded_sum[boom] += active[boom]
+            points[boom, active[boom]] = exploded_sum[boom]
+            state[boom] = EXPLODE
+
+        defusing = np.flatnonzero(current == DEFUSE_STATE)
+        if defusing.size:
+            bot = active[defusing]
+            hands[defusing, bot, DEFUSE] -= 1
+            mode = defuse_modes[bot]
+            position = rng.integers(0, length[defusing] + 1)
+            position = np.where(mode == DEFUSE_MODES.index('top'), length[defusing], position)
+            position = np.where(mode == DEFUSE_MODES.index('bottom'), 0, position)
+            shift = columns > position[:, None]
+            rows = np.take_along_axis(deck[defusing], np.clip(columns - shift, 0, size - 1), axis=1)
+            rows[columns == position[:, None]] = KITTEN
+            deck[defusing] = rows
+            length[defusing] += 1
+            state[defusing] = NEXTBOT
+
+        exploding = np.flatnonzero(current == EXPLODE)
+        if exploding.size:
+            alive[exploding, active[exploding]] = False
+            alive_count[exploding] -= 1
+            state[exploding] = NEXTBOT
+            running[exploding[alive_count[exploding] <= 1]] = False
+
+        moving = np.flatnonzero(current == NEXTBOT)
+        if moving.size:
+            seats = (active[moving, None] + np.arange(1, bot_count + 1)) % bot_count
+            first = np.argmax(alive[moving[:, None], seats], axis=1)
+            active[moving] = seats[np.arange(moving.size), first]
+            state[moving] = PLAY
+
+        state[current == FUTURE] = PLAY
+
+    winners = np.argmax(alive, axis=1)
+    points[every_game, winners] = exploded_sum + np.where(winners > 0, 2, 1)
+    return BatchResult(points, winners, turns)
+
+
+def compare_statistics(policy_names: List[str], games: int,
+                       seed: int = None) -> List[Tuple[str, float, float, float]]:
+    """
+    Play the same policies on game.arena.Arena and in the batch and compare
+    mean points and win rate per seat and the mean number of turns.
+    :param policy_names: one TABLE_POLICIES name per seat
+    :param games: the number of games for each engine
+    :param seed: seeds the random module for the Arena games and the batch, fresh if None
+    :return: list of (statistic, arena mean, batch mean, distance in standard errors)
+    """
+    if seed is not None:
+        # Arena and TableBot draw from the random module
+        random.seed(seed)
+    policies = [TABLE_POLICIES[name] for name in policy_names]
+    batch = simulate_batch(policies, games, seed)
+    bots = [TableBot(f'{name}-{seat}', policy) for seat, (name, policy) in enumerate(zip(policy_names, policies))]
+    points = np.zeros((games, len(bots)))
+    winners = np.zeros(games, dtype=np.int64)
+    turns = np.zeros(games)
+    for game in range(games):
+        ranking, bot_points, turns[game] = play_game(bots)
+        winners[game] = ranking[0]
+        for seat, value in bot_points.items():
+            points[game, seat] = value
+
+    checks = [('turns', turns, batch.turns)]
+    for seat, name in enumerate(policy_names):
+        checks.append((f'{name}-{seat} points', points[:, seat], batch.points[:, seat]))
+        checks.append((f'{name}-{seat} wins', winners == seat, batch.winners == seat))
+    statistics = []
+    for label, arena_values, batch_values in checks:
+        error = math.sqrt(np.var(arena_values) / games + np.var(batch_values) / games) or 1e-9
+        distance = abs(np.mean(arena_values) - np.mean(batch_values)) / error
+        statistics.append((label, float(np.mean(arena_values)), float(np.mean(batch_values)), float(distance)))
+    return statistics
+
+
+def compare_with_arena(policy_names: List[str], games: int, seed: int = None) -> bool:
+    """
+    Print the comparison of compare_statistics.
+    :param policy_names: one TABLE_POLICIES name per seat
+    :param games: the number of games for each engine
+    :param seed: the seed of both engines, fresh if None
+    :return: True if all statistics agree within MAX_Z standard errors
+    """
+    agree = True
+    for label, arena_mean, batch_mean, distance in compare_statistics(policy_names, games, seed):
+        status = 'ok' if distance < MAX_Z else 'MISMATCH'
+        agree = agree and distance < MAX_Z
+        print(f'{label:<24}{arena_mean:>10.3f}{batch_mean:>10.3f}{distance:>8.2f}  {status}')
+    return agree
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate many games at once with table policies.')
+    parser.add_argument('games', type=int, help='number of games')
+    parser.add_argument('policies', nargs='+', choices=list(TABLE_POLICIES), help='one per seat')
+    parser.add_argument('--check', type=int, metavar='GAMES',
+                        help='compare against game.arena.Arena with this many games')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    if args.check:
+        print(f'{"Statistic":<24}{"Arena":>10}{"Batch":>10}{"z":>8}')
+        raise SystemExit(0 if compare_with_arena(args.policies, args.check, args.seed) else 1)
+
+    started = time.perf_counter()
+    result = simulate_batch([TABLE_POLICIES[name] for name in args.policies], args.games, args.seed)
+    elapsed = time.perf_counter() - started
+    print(f'{args.games} games, {result.turns.sum()} turns in {elapsed:.2f}s')
+    print(f'{"Seat":<24}{"Win%":>8}{"Avg pts":>10}')
+    for seat, name in enumerate(args.policies):
+        print(f'{name + "-" + str(seat):<24}{np.mean(result.winners == seat):>8.1%}'
+              f'{result.points[:, seat].mean():>10.2f}')
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from enum import Enum
+from enum import Enum, IntEnum
 
 
 class CardType(Enum):
@@ -22,6 +22,56 @@ class CardCounts:
     NORMAL: int
     SHUFFLE: int
 
-@dataclass
-class Card:
-    card_type: CardType
+
+class Card(IntEnum):
+    """ A card as a small int, in the order of CardType. Decks store these in a bytearray. """
+    EXPLODING_KITTEN = 0
+    DEFUSE = 1
+    SKIP = 2
+    # ATTACK
+    SEE_THE_FUTURE = 3
+    NORMAL = 4
+    SHUFFLE = 5
+
+    @property
+    def card_type(self) -> CardType:
+        """ returns the card type """
+        return CardType[self.name]
+
+
+CARD_NAMES = tuple(card.name for card in Card)
+CARD_CODES = {card.name: int(card) for card in Card}
+
+
+class Hand:
+    """ The cards of a bot as a count per card. """
+    __slots__ = ('_counts',)
+
+    def __init__(self):
+        self._counts = [0] * len(Card)
+
+    def add(self, card: int) -> None:
+        """ adds one card """
+        self._counts[card] += 1
+
+    def remove(self, card: int) -> bool:
+        """ removes one card, returns False if the bot has none """
+        if self._counts[card]:
+            self._counts[card] -= 1
+            return True
+        return False
+
+    def count(self, card: int) -> int:
+        """ returns the number of cards of this kind """
+        return self._counts[card]
+
+    def __contains__(self, card) -> bool:
+        return self._counts[card] > 0
+
+    def __len__(self) -> int:
+        return sum(self._counts)
+
+    def __iter__(self):
+        for card, count in enumerate(self._counts):
+            for _ in range(count):
+                yield card
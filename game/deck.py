@@ -0,0 +1,107 @@
+""" Provides the deck as a blocked list of card codes. """
+from typing import Iterable, List
+
+
+class Deck:
+    """
+    The deck as a list of small bytearray blocks, so that inserting a card
+    at any position only moves the cards of one block.
+    Position 0 is the bottom of the deck, cards are drawn from the end.
+    """
+    BLOCK_SIZE = 64
+
+    def __init__(self, cards: Iterable[int] = ()):
+        self._blocks = []
+        self._size = 0
+        self._rebuild(bytearray(cards))
+
+    def pop(self) -> int:
+        """
+        Draw the top card.
+        :return: the card code
+        """
+        block = self._blocks[-1]
+        if not block:
+            raise IndexError('pop from empty deck')
+        card = block.pop()
+        self._size -= 1
+        if not block and len(self._blocks) > 1:
+            self._blocks.pop()
+        return card
+
+    def append(self, card: int) -> None:
+        """
+        Put a card on top of the deck.
+        :param card: the card code
+        :return: None
+        """
+        self._blocks[-1].append(card)
+        self._size += 1
+        self._split(len(self._blocks) - 1)
+
+    def insert(self, position: int, card: int) -> None:
+        """
+        Put a card at the position, like list.insert.
+        :param position: the position, 0 is the bottom
+        :param card: the card code
+        :return: None
+        """
+        position = max(0, min(position, self._size))
+        for number, block in enumerate(self._blocks):
+            if position <= len(block):
+                block.insert(position, card)
+                self._size += 1
+                self._split(number)
+                return
+            position -= len(block)
+
+    def shuffle(self, rng) -> None:
+        """
+        Shuffle the deck.
+        :param rng: random.Random or the random module
+        :return: None
+        """
+        cards = self.cards()
+        rng.shuffle(cards)
+        self._rebuild(cards)
+
+    def cards(self) -> bytearray:
+        """
+        All cards from bottom to top.
+        :return: bytearray of card codes
+        """
+        return bytearray().join(self._blocks)
+
+    def _split(self, number: int) -> None:
+        """
+        Split a block that grew to twice the block size.
+        :param number: the index of the block
+        :return: None
+        """
+        block = self._blocks[number]
+        if len(block) >= 2 * self.BLOCK_SIZE:
+            self._blocks[number:number + 1] = [block[:self.BLOCK_SIZE], block[self.BLOCK_SIZE:]]
+
+    def _rebuild(self, cards: bytearray) -> None:
+        """
+        Replace the blocks with the cards.
+        :param cards: the card codes from bottom to top
+        :return: None
+        """
+        size = self.BLOCK_SIZE
+        blocks: List[bytearray] = [cards[start:start + size] for start in range(0, len(cards), size)]
+        self._blocks = blocks or [bytearray()]
+        self._size = len(cards)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index: int) -> int:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError('deck index out of range')
+        for block in self._blocks:
+            if index < len(block):
+                return block[index]
+            index -= len(block)
@@ -0,0 +1,260 @@
+""" Plays rounds in-process against Python bots, without the network. """
+import argparse
+import importlib
+import random
+import time
+from collections import Counter
+from dataclasses import astuple
+from typing import Dict, List
+
+from game.arena import Arena
+from game.bot import Bot
+from game.cards import CardCounts
+
+PLAYABLE = ['SKIP', 'SEE_THE_FUTURE', 'NORMAL', 'SHUFFLE']
+
+
+class PolicyBot(Bot):
+    """
+    A bot that runs in the same process as the arena.
+    It receives the same events as a networked bot, as method calls.
+    Subclasses override choose_card and choose_position.
+    """
+
+    def __init__(self, name: str):
+        super().__init__()
+        self._name = name
+
+    def start(self, bots: List[str], card_counts: CardCounts) -> None:
+        """
+        A new round starts.
+        :param bots: the names of the bots in seat order
+        :param card_counts: the number of cards of each type
+        :return: None
+        """
+        self.hand = []
+        self.alive = True
+
+    def draw(self, card: str) -> None:
+        """
+        The bot drew a card.
+        :param card: the name of the card
+        :return: None
+        """
+        self.hand.append(card)
+
+    def play(self) -> str:
+        """
+        The bot has to play a card or 'NONE' to draw.
+        :return: the name of the card
+        """
+        card = self.choose_card()
+        if card in self.hand:
+            self.hand.remove(card)
+        return card
+
+    def defuse(self, decksize: int) -> int:
+        """
+        The bot defused an exploding kitten and puts it back into the deck.
+        :param decksize: the number of cards in the deck
+        :return: the position of the kitten, 0 is the bottom
+        """
+        if 'DEFUSE' in self.hand:
+            self.hand.remove('DEFUSE')
+        return self.choose_position(decksize)
+
+    def future(self, cards: List[str]) -> None:
+        """
+        The bot has seen the future.
+        :param cards: the names of up to three cards
+        :return: None
+        """
+
+    def inform(self, botname: str, event: str, data) -> None:
+        """
+        Another bot (or this one) took an action.
+        :param botname: the name of the acting bot
+        :param event: PLAY, DRAW, DEFUSE or EXPLODE
+        :param data: the played card for PLAY
+        :return: None
+        """
+
+    def choose_card(self) -> str:
+        """
+        Choose the card to play.
+        :return: the name of the card or 'NONE'
+        """
+        return 'NONE'
+
+    def choose_position(self, decksize: int) -> int:
+        """
+        Choose where to put the defused exploding kitten.
+        :param decksize: the number of cards in the deck
+        :return: the position, 0 is the bottom
+        """
+        return random.randint(0, decksize)
+
+    @property
+    def name(self):
+        """ returns the name """
+        return self._name
+
+
+class PassiveBot(PolicyBot):
+    """ Never plays a card. """
+
+
+class RandomBot(PolicyBot):
+    """ Plays a random card half of the time. """
+
+    def choose_card(self) -> str:
+        playable = [card for card in self.hand if card in PLAYABLE]
+        if playable and random.random() < 0.5:
+            return random.choice(playable)
+        return 'NONE'
+
+
+class CautiousBot(PolicyBot):
+    """
+    Counts the exploding kittens and the deck size from the events
+    and skips when drawing gets too dangerous.
+    """
+
+    def start(self, bots: List[str], card_counts: CardCounts) -> None:
+        super().start(bots, card_counts)
+        self._kittens = card_counts.EXPLODING_KITTEN
+        # Everything but the seven cards dealt to each bot is in the deck
+        self._decksize = sum(astuple(card_counts)) - 7 * len(bots)
+
+    def inform(self, botname: str, event: str, data) -> None:
+        if event == 'DRAW':
+            self._decksize -= 1
+        elif event == 'EXPLODE':
+            self._kittens -= 1
+            self._decksize -= 1
+
+    def choose_card(self) -> str:
+        risk = self._kittens / self._decksize if self._decksize > 0 else 1.0
+        if risk > 0.2:
+            for card in ['SKIP', 'SHUFFLE']:
+                if card in self.hand:
+                    return card
+        return 'NONE'
+
+    def choose_position(self, decksize: int) -> int:
+        # On top of the deck, the next bot draws it
+        return decksize
+
+
+POLICIES = {
+    'passive': PassiveBot,
+    'random': RandomBot,
+    'cautious': CautiousBot,
+}
+
+
+def load_policy(spec: str) -> type:
+    """
+    Find the policy class by its short name or as 'module:Class'.
+    :param spec: the policy name
+    :return: the PolicyBot subclass
+    """
+    if spec in POLICIES:
+        return POLICIES[spec]
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def play_game(bots: List[PolicyBot]) -> [List[int], Dict[int, int], int]:
+    """
+    Play one round with the bots in seat order.
+    :param bots: the policy bots
+    :return:
+    - the ranking as seat numbers, winner first
+    - the ranking points per seat number
+    - the number of turns
+    """
+    arena = Arena(verbose=False)
+    card_counts = arena.start_round(len(bots))
+    names = [bot.name for bot in bots]
+    for bot_number, bot in enumerate(bots):
+        bot.start(names, card_counts)
+        for card in arena.read_hand(bot_number):
+            bot.draw(card)
+
+    alive_count = len(bots)
+    turns = 0
+    while alive_count > 1:
+        bot_number, action, data = arena.take_turn()
+        turns += 1
+        bot = bots[bot_number]
+        response = None
+        if action == 'PLAY':
+            response = bot.play()
+            _inform(bots, bot.name, 'PLAY', response)
+        elif action == 'DRAW':
+            if data != 'EXPLODING_KITTEN':
+                bot.draw(data)
+                _inform(bots, bot.name, 'DRAW', '')
+        elif action == 'DEFUSE':
+            response = str(bot.defuse(arena.deck_size))
+            _inform(bots, bot.name, 'DEFUSE', '')
+        elif action == 'EXPLODE':
+            bot.alive = False
+            alive_count -= 1
+            _inform(bots, bot.name, 'EXPLODE', '')
+        elif action == 'FUTURE':
+            bot.future(data)
+        arena.analyze_turn(response)
+
+    return arena.ranking, dict(arena.bot_ranking_points), turns
+
+
+def _inform(bots: List[PolicyBot], botname: str, event: str, data) -> None:
+    """
+    Inform all the bots of the action that just occurred.
+    :return: None
+    """
+    for bot in bots:
+        bot.inform(botname, event, data)
+
+
+def simulate(policies: List[str], games: int) -> None:
+    """
+    Play the games, rotating the seats, and print win rates and ranking points.
+    :param policies: the policy names, one bot per name
+    :param games: the number of games
+    :return: None
+    """
+    bots = [load_policy(spec)(f'{spec}-{seat}') for seat, spec in enumerate(policies)]
+    wins = Counter()
+    points = {bot.name: Counter() for bot in bots}
+    turns = 0
+    started = time.perf_counter()
+    for game in range(games):
+        shift = game % len(bots)
+        seats = bots[shift:] + bots[:shift]
+        ranking, bot_points, game_turns = play_game(seats)
+        turns += game_turns
+        wins[seats[ranking[0]].name] += 1
+        for seat, value in bot_points.items():
+            points[seats[seat].name][value] += 1
+    elapsed = time.perf_counter() - started
+
+    print(f'{games} games, {turns} turns in {elapsed:.2f}s '
+          f'({turns / elapsed * 60:,.0f} turns per minute)')
+    print(f'{"Bot":<24}{"Win%":>8}{"Avg pts":>10}  Points distribution')
+    for bot in bots:
+        distribution = points[bot.name]
+        average = sum(value * count for value, count in distribution.items()) / games
+        spread = ' '.join(f'{value}:{count / games:.0%}' for value, count in sorted(distribution.items()))
+        print(f'{bot.name:<24}{wins[bot.name] / games:>8.1%}{average:>10.2f}  {spread}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate rounds with in-process bots.')
+    parser.add_argument('games', type=int, help='number of games')
+    parser.add_argument('policies', nargs='+',
+                        help=f'one per bot: {", ".join(POLICIES)} or module:Class')
+    args = parser.parse_args()
+    simulate(args.policies, args.games)
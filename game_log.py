@@ -0,0 +1,161 @@
+""" Provides the log of a game round. """
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import ExitStack
+
+from binary_log import BinaryLogWriter
+from instrumentation import timed
+from settings import LOG_FLUSH_INTERVAL, LOG_FLUSH_SIZE, LOG_FORMATS, LOG_FSYNC, LOG_QUEUE_SIZE
+
+FSYNC_POLICIES = ('never', 'flush', 'close')
+LOG_FORMAT_NAMES = ('text', 'json', 'binary')
+
+
+class GameLog:
+    """
+    Writes the events of one round to a .log (text), a .json and/or a .klog (binary) file.
+    The events are handed to a writer thread that keeps the files open
+    for the whole round and flushes them after flush_size events,
+    after flush_interval seconds and when the log is closed.
+    """
+
+    def __init__(
+            self,
+            logpath: str,
+            logfile: str,
+            flush_size: int = LOG_FLUSH_SIZE,
+            flush_interval: float = LOG_FLUSH_INTERVAL,
+            queue_size: int = LOG_QUEUE_SIZE,
+            fsync: str = LOG_FSYNC,
+            formats: tuple = LOG_FORMATS
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f'Invalid fsync policy {fsync!r}.')
+        for log_format in formats:
+            if log_format not in LOG_FORMAT_NAMES:
+                raise ValueError(f'Invalid log format {log_format!r}.')
+        self._formats = formats
+        self._logpath = logpath
+        self._logfile = logfile
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        self._fsync = fsync
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = None
+        self._error = None
+
+    def write(self, botname: str, action: str, response) -> None:
+        """
+        Log the game actions
+        :param botname:
+        :param action:
+        :param response:
+        :return:
+        """
+        with timed('log.write'):
+            if self._error is not None:
+                raise self._error
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name=f'GameLog {self._logfile}', daemon=True)
+                self._writer.start()
+            self._queue.put((botname, action, response))
+
+    def close(self) -> None:
+        """
+        Write the remaining events and close the files.
+        :return: None
+        """
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def _run(self) -> None:
+        """
+        The writer thread: writes the queued events until close() is called.
+        :return: None
+        """
+        path = f'{self._logpath}/{self._logfile}'
+        try:
+            with ExitStack() as stack:
+                textfile = jsonfile = binaryfile = None
+                if 'text' in self._formats:
+                    textfile = stack.enter_context(open(f'{path}.log', 'a'))
+                if 'json' in self._formats:
+                    jsonfile = stack.enter_context(open(f'{path}.json', 'a'))
+                if 'binary' in self._formats:
+                    binaryfile = BinaryLogWriter(f'{path}.klog')
+                    stack.callback(binaryfile.close)
+                self._write_events(textfile, jsonfile, binaryfile)
+        except Exception as e:
+            print(f'Error: writing the game log {self._logfile} failed: {e!r}')
+            self._error = e
+            # Keep draining so the game never blocks on a full queue
+            while self._queue.get() is not None:
+                pass
+
+    def _write_events(self, textfile, jsonfile, binaryfile) -> None:
+        """
+        Write the events to the open files, flushing by size and time.
+        :param textfile: the .log file or None
+        :param jsonfile: the .json file or None
+        :param binaryfile: the BinaryLogWriter or None
+        :return: None
+        """
+        logfiles = [logfile for logfile in (textfile, jsonfile, binaryfile) if logfile is not None]
+        pending = 0
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(0.0, self._flush_interval - (time.monotonic() - last_flush))
+            try:
+                event = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                event = ()
+            if event is None:
+                break
+            if event:
+                botname, action, response = event
+                if textfile is not None:
+                    textfile.write(f'{botname} / {action} / {response}\n')
+                if jsonfile is not None:
+                    entry = {
+                        'action': action,
+                        'botname': botname,
+                        'response': response,
+                    }
+                    jsonfile.write(f'{json.dumps(entry)}\n')
+                if binaryfile is not None:
+                    binaryfile.write(botname, action, response)
+                pending += 1
+            if pending and (pending >= self._flush_size
+                            or time.monotonic() - last_flush >= self._flush_interval):
+                self._flush(logfiles, self._fsync == 'flush')
+                pending = 0
+            if not pending:
+                last_flush = time.monotonic()
+        self._flush(logfiles, self._fsync != 'never')
+
+    @staticmethod
+    def _flush(logfiles, sync: bool) -> None:
+        """
+        Flush the files to the operating system and optionally to the disk.
+        :return: None
+        """
+        with timed('log.flush'):
+            for logfile in logfiles:
+                logfile.flush()
+                if sync:
+                    os.fsync(logfile.fileno())
+
+    @property
+    def path(self):
+        """ returns the path of the logfiles without extension """
+        return f'{self._logpath}/{self._logfile}'
+
+    @property
+    def logfile(self):
+        """ returns the name of the logfile without extension """
+        return self._logfile
@@ -0,0 +1,192 @@
+""" Counters and timing histograms for the hot paths of a round. """
+import json
+import math
+import time
+from collections import defaultdict
+from typing import Dict, Tuple
+
+# 0: errors only, 1: the game, 2: every message
+VERBOSITY = 2
+
+# Bucket i holds the durations below 2**i microseconds
+BUCKETS = 28
+
+
+class Histogram:
+    """ Count, sum, min, max and power-of-two buckets of durations in seconds. """
+    __slots__ = ('count', 'total', 'minimum', 'maximum', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = math.inf
+        self.maximum = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def observe(self, seconds: float) -> None:
+        """ adds one duration """
+        self.count += 1
+        self.total += seconds
+        if seconds < self.minimum:
+            self.minimum = seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        bucket = int(seconds * 1e6).bit_length()
+        self.buckets[bucket if bucket < BUCKETS else BUCKETS - 1] += 1
+
+    def merge(self, other: 'Histogram') -> None:
+        """ adds the durations of the other histogram """
+        self.count += other.count
+        self.total += other.total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        for bucket, count in enumerate(other.buckets):
+            self.buckets[bucket] += count
+
+    def percentile(self, fraction: float) -> float:
+        """
+        The upper bound of the bucket holding the percentile.
+        :param fraction: 0.5 for the median, 0.99 for p99
+        :return: seconds, at most the maximum
+        """
+        rank = max(1, math.ceil(fraction * self.count))
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(2 ** bucket / 1e6, self.maximum)
+        return self.maximum
+
+    def summary(self) -> dict:
+        """ returns count, total, mean, p50, p99 and max """
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(0.5),
+            'p99': self.percentile(0.99),
+            'max': self.maximum,
+        }
+
+
+class Metrics:
+    """
+    Counters and histograms by name and an optional label, e.g. the bot name.
+    One instance per process; a round resets it when it starts.
+    """
+
+    def __init__(self):
+        self.counters: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.histograms: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+
+    def count(self, name: str, value: int = 1, label: str = '') -> None:
+        """ adds value to a counter """
+        self.counters[name, label] += value
+
+    def observe(self, name: str, seconds: float, label: str = '') -> None:
+        """ adds a duration to a histogram """
+        self.histograms[name, label].observe(seconds)
+
+    def reset(self) -> None:
+        """ forgets all values """
+        self.counters.clear()
+        self.histograms.clear()
+
+    def summary(self) -> dict:
+        """
+        All values, the unlabelled ones by name, the labelled ones by label and name.
+        :return: dict with phases, counters and labels
+        """
+        summary = {'phases': {}, 'counters': {}, 'labels': {}}
+        for (name, label), histogram in sorted(self.histograms.items()):
+            target = summary['labels'].setdefault(label, {}) if label else summary['phases']
+            target[name] = histogram.summary()
+        for (name, label), value in sorted(self.counters.items()):
+            if label:
+                summary['labels'].setdefault(label, {})[name] = value
+            else:
+                summary['counters'][name] = value
+        return summary
+
+
+METRICS = Metrics()
+
+
+class timed:
+    """
+    Context manager adding the time of its block to a histogram.
+    with timed('arena.take_turn'): ...
+    """
+    __slots__ = ('_name', '_label', '_started')
+
+    def __init__(self, name: str, label: str = ''):
+        self._name = name
+        self._label = label
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        METRICS.observe(self._name, time.perf_counter() - self._started, self._label)
+        return False
+
+
+def set_verbosity(level: int) -> None:
+    """
+    Set how much is printed.
+    :param level: 0 errors only, 1 the game, 2 every message
+    :return: None
+    """
+    global VERBOSITY
+    VERBOSITY = level
+
+
+def write_summary(path: str, title: str, wall: float) -> dict:
+    """
+    Write the metrics as path.summary.json and path.summary.txt.
+    :param path: the game log path without extension
+    :param title: the first line of the text summary
+    :param wall: the wall time of the round in seconds
+    :return: the summary
+    """
+    summary = METRICS.summary()
+    summary['wall'] = wall
+    with open(f'{path}.summary.json', 'w') as jsonfile:
+        json.dump(summary, jsonfile, indent=2)
+    with open(f'{path}.summary.txt', 'w') as textfile:
+        textfile.write(format_summary(summary, title))
+    return summary
+
+
+def format_summary(summary: dict, title: str) -> str:
+    """
+    The summary as text tables.
+    :param summary: the result of Metrics.summary with the wall time
+    :param title: the first line
+    :return: str
+    """
+    wall = summary.get('wall') or 0.0
+    lines = [title, f'Wall time {wall:.3f}s', '']
+    header = f'{"":<28}{"count":>8}{"total s":>10}{"% wall":>8}{"mean ms":>10}{"p50 ms":>10}{"p99 ms":>10}'
+
+    def rows(histograms: dict) -> None:
+        for name, values in histograms.items():
+            if not isinstance(values, dict):
+                continue
+            share = values['total'] / wall * 100 if wall else 0.0
+            lines.append(f'{name:<28}{values["count"]:>8}{values["total"]:>10.3f}{share:>7.1f}%'
+                         f'{values["mean"] * 1000:>10.3f}{values["p50"] * 1000:>10.3f}'
+                         f'{values["p99"] * 1000:>10.3f}')
+
+    lines.append(header)
+    rows(summary['phases'])
+    for label, values in summary['labels'].items():
+        lines.extend(['', label, header])
+        rows(values)
+        counters = ', '.join(f'{name} {value}' for name, value in values.items() if not isinstance(value, dict))
+        if counters:
+            lines.append(counters)
+    if summary['counters']:
+        lines.extend(['', ', '.join(f'{name} {value}' for name, value in summary['counters'].items())])
+    return '\n'.join(lines) + '\n'
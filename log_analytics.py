@@ -0,0 +1,272 @@
+""" Statistics per bot and per action over a directory of game logs. """
+import argparse
+import json
+import os
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, Tuple
+
+from game.arena import CARD_NOT_IN_HAND
+from replay import read_events
+
+RANK = re.compile(r'^\d+\.$')
+CACHE_FILE = '.analytics_cache.json'
+# Bump when the summaries change, older caches are ignored
+CACHE_VERSION = 2
+
+
+def new_bot() -> dict:
+    """ returns the empty statistics of a bot """
+    return {
+        'rounds': 0, 'wins': 0, 'points': 0, 'explosions': 0, 'disqualifications': 0,
+        'timeouts': 0, 'defuses': 0, 'plays': {}, 'defuse_positions': {},
+    }
+
+
+def summarize_file(path: str) -> dict:
+    """
+    Read a game log event by event and count what happened in its rounds.
+    Runs in a worker process, the result is cached as json.
+    :param path: the .json or .klog game log
+    :return: dict with rounds, finished, turns (rounds by number of turns), bots and actions,
+        or with error if the log can't be read
+    """
+    summary = {'rounds': 0, 'finished': 0, 'turns': Counter(), 'bots': {}, 'actions': Counter()}
+    bots = defaultdict(new_bot)
+    open_round = False
+    dealt = False
+    turns = 0
+    try:
+        for botname, action, response in read_events(path):
+            if botname == 'Game':
+                if action == 'START':
+                    summary['rounds'] += 1
+                    open_round, dealt, turns = True, False, 0
+                    for name in str(response).split(','):
+                        bots[name]['rounds'] += 1
+                elif action == 'OVER' and open_round:
+                    summary['finished'] += 1
+                    summary['turns'][str(turns)] += 1
+                    open_round = False
+                continue
+            if RANK.match(str(botname)):
+                bot = bots[action]
+                if botname == '1.':
+                    bot['wins'] += 1
+                bot['points'] += int(str(response).split()[0])
+                continue
+            summary['actions'][action] += 1
+            bot = bots[botname]
+            if action == 'PLAY':
+                # The deal is over once the first bot plays
+                dealt = True
+                bot['plays'][response] = bot['plays'].get(response, 0) + 1
+                if response == 'SKIP':
+                    turns += 1
+            elif action == 'DRAW' and dealt:
+                # A turn ends with a draw or a skip
+                turns += 1
+            elif action == 'DEFUSE':
+                bot['defuses'] += 1
+                position = str(response)
+                bot['defuse_positions'][position] = bot['defuse_positions'].get(position, 0) + 1
+            elif action == 'EXPLODE':
+                bot['explosions'] += 1
+                if response == CARD_NOT_IN_HAND:
+                    bot['disqualifications'] += 1
+            elif action == 'TIMEOUT':
+                bot['timeouts'] += 1
+    except Exception as e:
+        # A truncated or unfinished log (struct.error, IndexError, ...) is reported, it doesn't end the run
+        return {'error': repr(e)}
+    summary['bots'] = dict(bots)
+    return summary
+
+
+def merge(total: dict, summary: dict) -> None:
+    """
+    Add the counts of a summary to the total, nested dicts key by key.
+    :param total: the summary added to
+    :param summary: the summary to add
+    :return: None
+    """
+    for key, value in summary.items():
+        if isinstance(value, dict):
+            merge(total.setdefault(key, {}), value)
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def find_logs(logpath: str, extension: str) -> Iterator[str]:
+    """
+    The game logs in a directory, without the round summaries and the cache.
+    :param logpath: the log directory
+    :param extension: .json or .klog
+    :return: iterator of paths
+    """
+    with os.scandir(logpath) as entries:
+        for entry in entries:
+            name = entry.name
+            if (entry.is_file() and name.endswith(extension) and not name.endswith('.summary.json')
+                    and name != CACHE_FILE):
+                yield entry.path
+
+
+def load_cache(path: str) -> Dict[str, Dict[str, dict]]:
+    """
+    Read the cached summaries.
+    :param path: the cache file
+    :return: dict of extension -> log name -> {mtime, size, summary}, empty if missing or outdated
+    """
+    try:
+        with open(path) as cachefile:
+            cache = json.load(cachefile)
+    except (OSError, ValueError):
+        return {}
+    return cache['extensions'] if cache.get('version') == CACHE_VERSION else {}
+
+
+def save_cache(path: str, extension: str, files: Dict[str, dict]) -> None:
+    """
+    Write the cached summaries of one extension, keeping those of the others,
+    and replace the old cache at once.
+    :param path: the cache file
+    :param extension: .json or .klog
+    :param files: dict of log name -> {mtime, size, summary}
+    :return: None
+    """
+    extensions = load_cache(path)
+    extensions[extension] = files
+    temporary = f'{path}.tmp'
+    try:
+        with open(temporary, 'w') as cachefile:
+            json.dump({'version': CACHE_VERSION, 'extensions': extensions}, cachefile)
+        os.replace(temporary, path)
+    except OSError as e:
+        print(f'Error: writing the cache {path} failed: {e!r}')
+
+
+def analyze(logpath: str, workers: int = None, extension: str = '.json', use_cache: bool = True) -> Tuple[dict, int]:
+    """
+    Summarize all game logs of a directory. Logs whose mtime and size are
+    unchanged come from the cache, the others are read on a process pool.
+    :param logpath: the log directory
+    :param workers: the number of worker processes, the number of CPUs if None
+    :param extension: .json or .klog
+    :param use_cache: read and write the cache in the log directory
+    :return: the total summary and the number of logs read, not taken from the cache
+    """
+    cache_path = os.path.join(logpath, CACHE_FILE)
+    cached = load_cache(cache_path).get(extension, {}) if use_cache else {}
+    files = {}
+    stale = []
+    read = 0
+    for path in find_logs(logpath, extension):
+        name = os.path.basename(path)
+        stat = os.stat(path)
+        entry = cached.get(name)
+        if entry is not None and entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            files[name] = entry
+        else:
+            stale.append((name, path, stat))
+
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(stale) // ((workers or os.cpu_count() or 1) * 4))
+            summaries = executor.map(summarize_file, [path for _, path, _ in stale], chunksize=chunksize)
+            for (name, path, stat), summary in zip(stale, summaries):
+                if 'error' in summary:
+                    print(f'Error: reading {path} failed: {summary["error"]}')
+                    continue
+                files[name] = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'summary': summary}
+                read += 1
+    if use_cache:
+        save_cache(cache_path, extension, files)
+
+    total = {'logs': len(files)}
+    for entry in files.values():
+        merge(total, entry['summary'])
+    return total, read
+
+
+def turn_stats(turns: Dict[str, int]) -> Tuple[float, int, int]:
+    """
+    The mean, median and most turns per finished round.
+    :param turns: dict of number of turns -> rounds
+    :return: (mean, median, max)
+    """
+    counts = sorted((int(number), rounds) for number, rounds in turns.items())
+    rounds = sum(count for _, count in counts)
+    if not rounds:
+        return 0.0, 0, 0
+    mean = sum(number * count for number, count in counts) / rounds
+    seen = 0
+    median = counts[-1][0]
+    for number, count in counts:
+        seen += count
+        if seen * 2 >= rounds:
+            median = number
+            break
+    return mean, median, counts[-1][0]
+
+
+def format_report(total: dict) -> str:
+    """
+    The statistics as text tables.
+    :param total: the result of analyze
+    :return: str
+    """
+    rounds = total.get('rounds', 0)
+    mean, median, most = turn_stats(total.get('turns', {}))
+    lines = [f'{total.get("logs", 0)} logs, {rounds} rounds, {total.get("finished", 0)} finished',
+             f'Turns per finished round: mean {mean:.1f}, median {median}, max {most}', '',
+             f'{"Bot":<24}{"Rounds":>8}{"Wins":>7}{"Win %":>7}{"Points":>8}{"Mean":>7}'
+             f'{"Exploded":>10}{"Disq.":>7}{"Disq. %":>9}{"Timeouts":>10}{"Defuses":>9}']
+    bots = total.get('bots', {})
+    for name, bot in sorted(bots.items(), key=lambda item: -item[1]['points'] / max(1, item[1]['rounds'])):
+        played = max(1, bot['rounds'])
+        lines.append(f'{name:<24}{bot["rounds"]:>8}{bot["wins"]:>7}{bot["wins"] / played:>7.1%}'
+                     f'{bot["points"]:>8}{bot["points"] / played:>7.2f}{bot["explosions"]:>10}'
+                     f'{bot["disqualifications"]:>7}{bot["disqualifications"] / played:>9.1%}'
+                     f'{bot["timeouts"]:>10}{bot["defuses"]:>9}')
+
+    lines.extend(['', 'Actions'])
+    for action, count in sorted(total.get('actions', {}).items(), key=lambda item: -item[1]):
+        lines.append(f'  {action:<12}{count:>10}')
+
+    lines.extend(['', 'Cards played'])
+    for name, bot in sorted(bots.items()):
+        if bot['plays']:
+            lines.append(f'  {name:<22}' + ', '.join(f'{card} {count}' for card, count in
+                                                     sorted(bot['plays'].items(), key=lambda item: -item[1])))
+
+    lines.extend(['', 'Defused kittens put back at position'])
+    for name, bot in sorted(bots.items()):
+        if bot['defuse_positions']:
+            lines.append(f'  {name:<22}' + ', '.join(f'{position}: {count}' for position, count in
+                                                     sorted(bot['defuse_positions'].items(), key=position_key)))
+    return '\n'.join(lines) + '\n'
+
+
+def position_key(item: Tuple[str, int]) -> Tuple[int, object]:
+    """ sorts the defuse positions by number, answers that aren't numbers last """
+    position = item[0]
+    return (0, int(position)) if position.lstrip('-').isdigit() else (1, position)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Statistics per bot and per action over the game logs.')
+    parser.add_argument('logpath', help='the directory of the game logs')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, the number of CPUs by default')
+    parser.add_argument('--klog', action='store_true', help='read the binary .klog logs instead of the .json logs')
+    parser.add_argument('--no-cache', action='store_true', help='read every log again and leave the cache alone')
+    parser.add_argument('--json', action='store_true', help='print the statistics as json')
+    args = parser.parse_args()
+
+    statistics, read = analyze(args.logpath, args.workers, '.klog' if args.klog else '.json', not args.no_cache)
+    if args.json:
+        print(json.dumps(statistics, indent=2))
+    else:
+        print(f'{read} logs read, {statistics["logs"] - read} from the cache')
+        print(format_report(statistics))
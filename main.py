@@ -1,215 +1,224 @@
-import json
-import os
+import asyncio
 import multiprocessing
-import selectors
-import socket
+import queue
+import sqlite3
 import sys
 import time
 import traceback
 from datetime import datetime
-from typing import List
 
-from client_message import ClientMessage
-from game.arena import Arena
-from game.bot import Bot
+from arena_driver import RoundResult, run_round
+from bot_probe import admit_bots, probe_bots
+from clowder import ClowderRegistry
+from game_log import GameLog
+from instrumentation import set_verbosity
+from metrics_server import MetricsServer, TournamentMetrics
+from message import set_json_codec
+from results_store import ResultsStore
+from settings import (JSON_CODEC, PROBE_COUNT, PROBE_MAX_P50, PROBE_MAX_P99, PROBE_TIMEOUT,
+                      METRICS_HOST, METRICS_PORT, ROUND_COOLDOWN, ROUND_DEADLINE, ROUND_GRACE,
+                      RESULTS_DB, ROUND_SEED, STANDINGS_CONFIDENCE, TOURNAMENT_CHECKPOINT, TOURNAMENT_MIN_ROUNDS,
+                      VERBOSITY)
+from standings import DuplicateStandings, Standings
+from tournament import run_duplicate, run_tournament
+from tournament_control import TournamentControl
 
 LOGFILE = datetime.now().strftime('%Y%m%d%H%M%S')
 CLOWDERHOST='127.0.0.1'
 CLOWDERPORT=65432
 LOGPATH='C:\BZZ\Modul321\lernbeurteilung1\kitten-combo\logs'
+REGISTRY = None
+RESULTS_STORE = None
+TOURNAMENT_METRICS = TournamentMetrics()
+
+set_json_codec(JSON_CODEC)
+set_verbosity(VERBOSITY)
 
 def main():
     """
     runs the arena for the kitten bots
     :return:
     """
-    global LOGFILE
     rounds = sys.argv[1] if len(sys.argv) > 1 else 1
-    total_rounds = 0
-    round_thread = None
-    round_start = None
-    
-    while total_rounds < int(rounds):
-        if round_thread is not None and round_start is not None:
-            if round_thread.is_alive():
-                if time.time() - round_start > 240:
-                    print(f'Round {total_rounds} is taking too long.')
-                    round_thread.terminate()
-                    round_thread.join()
-                    round_thread = None
-                    total_rounds += 1
-                else:
-                    continue
-            else:
-                round_thread = None
-                total_rounds += 1
-        else:
-            if round_start is not None and time.time() - round_start < 300:
-                continue
-            else:
-                try:
-                    round_start = time.time()
-                    LOGFILE = datetime.now().strftime('%Y%m%d%H%M%S')
-                    
-                    round_thread = multiprocessing.Process(target=game_round)
-                    round_thread.daemon = True
-                    round_thread.start()
-                    round_thread.join(timeout=240)
-                except Exception as e:
-                    print(f'Error occurred: {e}')
-                    traceback.print_exc()
-                finally:
-                    #input('Press Enter to continue...')
-                    pass
-    pass
-
-
-def game_round():
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = MetricsServer(TOURNAMENT_METRICS, METRICS_HOST, METRICS_PORT)
+        metrics_server.start()
+    try:
+        if len(sys.argv) > 3 and sys.argv[3] == 'duplicate':
+            if workers > 1:
+                print('Duplicate deals are played one round at a time, every rotation seats the same bots.')
+            run_duplicate_deals(int(rounds))
+            return
+        if workers > 1:
+            run_parallel(int(rounds), workers)
+            return
+        control = start_control(Standings(STANDINGS_CONFIDENCE), 'rounds', int(rounds), request_bots())
+        logprefix = datetime.now().strftime('%Y%m%d%H%M%S')
+        while not control.stop():
+            round_start = time.time()
+            round_number = control.standings.played
+            # A skipped round counts as cancelled
+            result = supervise_round(round_number, logprefix)
+            control.add_round(result or RoundResult(LOGFILE, round_number=round_number))
+            if not control.stop():
+                # The cool-down counts from the start of the round
+                time.sleep(max(0.0, ROUND_COOLDOWN - (time.time() - round_start)))
+        finish_control(control)
+    finally:
+        close_registry()
+        close_results_store()
+        if metrics_server is not None:
+            metrics_server.stop()
+
+
+def supervise_round(round_number, logprefix):
     """
-    Run a game round
+    Runs one round in its own process and waits for it to end
+    :param round_number: the number of the round
+    :param logprefix: the prefix of the logfile names, the round number is appended
+    :return: the RoundResult, None if the round was skipped
+    """
+    global LOGFILE
+    # Rounds that start within the same second still get their own log
+    LOGFILE = f'{logprefix}_{round_number:05d}'
+    try:
+        # The bot list and its health stay in this process across rounds
+        bot_list = admitted_bots()
+        if len(bot_list) < 2:
+            print(f'Round {round_number} skipped, only {len(bot_list)} bots admitted.')
+            return None
+        results = multiprocessing.Queue()
+        round_process = multiprocessing.Process(target=game_round,
+                                                args=(LOGFILE, bot_list, results, round_number))
+        round_process.daemon = True
+        round_process.start()
+        # The round cancels itself at the deadline, this is the backstop
+        round_process.join(timeout=ROUND_DEADLINE + ROUND_GRACE)
+        if round_process.is_alive():
+            print(f'Round {round_number} is taking too long.')
+            round_process.terminate()
+            round_process.join()
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            # The round was killed, it counts as cancelled
+            result = RoundResult(LOGFILE, round_number=round_number)
+        record_result(result)
+        return result
+    except Exception as e:
+        print(f'Error occurred: {e}')
+        traceback.print_exc()
+        return None
+
+
+def run_parallel(rounds, workers):
+    """
+    Runs the rounds on a pool of worker processes
+    :param rounds: the most rounds to play
+    :param workers: the number of worker processes, each with its own set of bots
     :return:
     """
-    bot_list = request_bots()
-    log_game('Game', 'START', ','.join([bot['name'] for bot in bot_list]))
-    alive_count = len(bot_list)
-    arena = Arena()
-    start_round(arena, bot_list)
-    print('----------- Game Start -----------')
-    save_bot = -1
-    while alive_count > 1:
-        bot_number, action, data = arena.take_turn()
-        active_bot = bot_list[bot_number]
-        if bot_number != save_bot:
-            print(f'Active bot: {active_bot["name"]}')
-            save_bot = bot_number
-        print(f'  - Action={action} / Data={data}')
-        if action == 'PLAY':
-            response = send_request(active_bot['ip'], active_bot['port'], {'action': action})
-            inform_bots(active_bot['name'], bot_list, 'PLAY', response)
-            log_game(active_bot['name'], action, response)
-        elif action == 'DRAW':
-            log_game(active_bot['name'], action, data)
-            if data == 'EXPLODING_KITTEN':
-                response = None
-            else:
-                response = send_request(active_bot['ip'], active_bot['port'],
-                                        {'action': 'DRAW', 'card': data})
-                inform_bots(active_bot['name'], bot_list, 'DRAW', '')
-            print(f'=> {arena.read_hand(bot_number)}')
-        elif action == 'DEFUSE':
-            response = send_request(active_bot['ip'], active_bot['port'],
-                                    {'action': 'DEFUSE', 'decksize': arena.deck_size})
-            print(f'  => Bot {active_bot["name"]} defused the exploding kitten')
-            log_game(active_bot['name'], action, response)
-            inform_bots(active_bot['name'], bot_list, 'DEFUSE', '')
-        elif action == 'EXPLODE':
-            response = send_request(active_bot['ip'], active_bot['port'], {'action': 'EXPLODE'})
-            print(f'  => Bot {active_bot["name"]} exploded')
-            log_game(active_bot['name'], action, data)
-            alive_count -= 1
-            inform_bots(active_bot['name'], bot_list, 'EXPLODE', '')
-        elif action == 'FUTURE':
-            response = send_request(active_bot['ip'], active_bot['port'],
-                                    {'action': 'FUTURE', 'cards': data})
-            log_game(active_bot['name'], action, data)
-        elif action == 'NEXTBOT':
-            response = None
-            # input('Press Enter to continue...')
-        print(f'  - Response={response}')
-        arena.analyze_turn(response)
-
-    finish_round(bot_list, arena)
-    pass
-
-
-def start_round(arena, bot_list):
+    logprefix = datetime.now().strftime('%Y%m%d%H%M%S')
+    control = start_control(Standings(STANDINGS_CONFIDENCE), 'rounds', rounds, request_bots())
+    for result in run_tournament(control.remaining, workers, admitted_bots, LOGPATH, logprefix,
+                                 ROUND_DEADLINE, ROUND_SEED,
+                                 first_round=control.standings.played, stop=control.stop):
+        record_result(result)
+        control.add_round(result)
+        status = 'finished' if result.finished else 'cancelled'
+        print(f'Round {result.round_number} {status} in {result.duration:.1f}s: '
+              f'{", ".join(result.ranking)}')
+    finish_control(control)
+
+
+def run_duplicate_deals(deals):
     """
-    Start a new round.
-    :param arena:
-    :param bot_list:
+    Plays each deal once per seat rotation of the bots and prints the standings per deal
+    :param deals: the most deals to play
     :return:
     """
-    card_counts = arena.start_round(len(bot_list))
-    give_cards(arena, bot_list)
-    data = {
-        'action': 'START',
-        'card_counts': [],
-        'bots': [bot['name'] for bot in bot_list],
-    }
-    for card in dir(card_counts):
-        if not card.startswith('__'):
-            data['card_counts'].append(
-                {
-                    'name': card,
-                    'count': getattr(card_counts, card),
-                }
-            )
-
-    ''' Inform all the bots that the round has started. '''
-    for bot in bot_list:
-        send_request(bot['ip'], bot['port'], data)
-
-
-def finish_round(bot_list: List[Bot], arena: Arena) -> None:
+    logprefix = datetime.now().strftime('%Y%m%d%H%M%S')
+    # Every rotation of every deal is played by the same bots
+    bot_list = admitted_bots()
+    if len(bot_list) < 2:
+        print(f'Tournament skipped, only {len(bot_list)} bots admitted.')
+        return
+    control = start_control(DuplicateStandings(len(bot_list), STANDINGS_CONFIDENCE), 'duplicate', deals, bot_list)
+    for result in run_duplicate(deals, lambda: bot_list, LOGPATH, logprefix,
+                                ROUND_DEADLINE, ROUND_SEED,
+                                done=control.standings.done, stop=control.stop):
+        record_result(result)
+        control.add_round(result)
+        status = 'finished' if result.finished else 'cancelled'
+        print(f'Deal {result.deal} round {result.round_number} {status} in {result.duration:.1f}s: '
+              f'{", ".join(result.ranking)}')
+    finish_control(control)
+
+
+def start_control(standings, mode, max_rounds, bot_list):
     """
-    Finish the round.
-    :param bot_list: List of Bot objects
-    :param arena: Arena object
-    :return: None
+    Creates the control of a tournament and resumes it from its checkpoint
+    :param standings: the empty Standings
+    :param mode: rounds or duplicate
+    :param max_rounds: the most rounds (deals) to play
+    :param bot_list: the bots of the tournament, a checkpoint of other bots is ignored
+    :return: the TournamentControl
     """
-    print('----------- Game Over -----------')
-
-    ranking = []
-    rank = 1
-    log_game('Game', 'OVER', '')
-    for bot_number in arena.ranking:
-        bot_name = bot_list[bot_number]['name']
-        bot_points = arena.bot_ranking_points[bot_number]
-        print(f'{rank}. {bot_name} ({bot_points} Punkte)')
-        log_game(f'{rank}.', f'{bot_name}', f'{bot_points} Punkte')
-        ranking.append(bot_name)
-        rank += 1
-
-    ''' Inform all the bots that the round has ended. '''
-    for bot in bot_list:
-        send_request(bot['ip'], bot['port'], {'action': 'OVER', 'ranks': ranking})
+    control = TournamentControl(standings, mode, max_rounds, TOURNAMENT_MIN_ROUNDS, TOURNAMENT_CHECKPOINT or None,
+                                [bot['name'] for bot in bot_list], ROUND_SEED)
+    control.resume()
+    return control
 
 
-def inform_bots(botname, bot_list: List[Bot], action: str, response: str) -> None:
+def finish_control(control):
     """
-    Inform all the bots of the action that just occurred.
-    :param botname: str The name of the bot who took the action
-    :param bot_list: List of Bot objects
-    :param action: str action
-    :param response: str the response from the bot
-    :return: None
+    Prints the standings and why the tournament ended
+    :param control: the TournamentControl
+    :return:
     """
+    print(control.standings.format())
+    if control.converged:
+        print(f'The ranking converged after {control.standings.played} rounds.')
+    control.finish()
 
-    for bot in bot_list:
-        data = {
-            'action': 'INFORM',
-            'botname': botname,
-            'event': action,
-            'data': response,
-        }
 
-        send_request(bot['ip'], bot['port'], data)
+def record_result(result):
+    """
+    Add the result of a round to the bot health, the tournament metrics and the results store
+    :param result: the RoundResult
+    :return:
+    """
+    get_registry().record_round(result.failures, result.answer_latencies)
+    TOURNAMENT_METRICS.record(result)
+    store = get_results_store()
+    if store is not None:
+        try:
+            store.add_round(result)
+        except sqlite3.Error as e:
+            print(f'Error: storing round {result.logfile} failed: {e!r}')
 
 
-def give_cards(arena: Arena, bot_list: List) -> None:
+def game_round(logfile=None, bot_list=None, results=None, round_number=0):
     """
-    Give cards to the bots in the list.
-    :param arena: Arena object
-    :param bot_list: List of Bot objects
-    :return: None
+    Run a game round
+    :param logfile: the name of the game log, defaults to LOGFILE
+    :param bot_list: the bots of the round, asks the clowder if None
+    :param results: a multiprocessing.Queue for the RoundResult or None
+    :param round_number: the number of the round in the tournament
+    :return:
     """
-    active_bot = 0
-    for bot in bot_list:
-        hand = arena.read_hand(active_bot)
-        for card in hand:
-            response = send_request(bot['ip'], bot['port'], {'action': 'DRAW', 'card': card})
-            log_game(bot['name'], 'DRAW', card)
-        active_bot += 1
+    if bot_list is None:
+        try:
+            bot_list = request_bots()
+        finally:
+            close_registry()
+    game_log = GameLog(LOGPATH, logfile or LOGFILE)
+    result = asyncio.run(run_round(bot_list, game_log, ROUND_DEADLINE, ROUND_SEED))
+    result.round_number = round_number
+    if results is not None:
+        results.put(result)
 
 
 def request_bots():
@@ -218,120 +227,65 @@ def request_bots():
     :return:
     """
 
-    action = {'action': 'QUERY', 'type': 'bot'}
-    response = send_request(CLOWDERHOST, CLOWDERPORT, action)
-    return response
+    return get_registry().bots()
 
 
-def send_request(ipaddr, port, action):
+def admitted_bots():
     """
-    Send a request to the server
-    :param ipaddr:
-    :param port:
-    :param action:
-    :return:
+    Request the bots and keep those that are reachable and answered fast enough in their last rounds
+    :return: list of bot dicts
     """
-
-    if type(port) == str:
-        port = int(port)
-    sel = selectors.DefaultSelector()
-    request = create_request(action)
-    start_connection(sel, ipaddr, port, request)
-
-    try:
-        while True:
-            events = sel.select(timeout=60)
-            for key, mask in events:
-                message = key.data
-                try:
-                    message.process_events(mask)
-                except Exception:
-                    print(
-                        f'Main: Error: Exception for {message.ipaddr}:\n'
-                        f'{traceback.format_exc()}'
-                    )
-                    message.close()
-            # Check for a socket being monitored to continue.
-            if not sel.get_map():
-                break
-    except KeyboardInterrupt:
-        print('Caught keyboard interrupt, exiting')
-    finally:
-        sel.close()
-    return process_response(action, message)
+    bot_list = request_bots()
+    probes = asyncio.run(probe_bots(bot_list, PROBE_COUNT, PROBE_TIMEOUT))
+    registry = get_registry()
+    for name, probe in probes.items():
+        registry.record_probe(name, probe.reachable)
+    return admit_bots(bot_list, probes, registry.health, PROBE_MAX_P50, PROBE_MAX_P99)
 
 
-def create_request(action_item):
+def get_registry():
     """
-    Create the request
-    :param action_item:
-    :return:
+    Get the bot registry of the clowder, kept for all rounds
+    :return: ClowderRegistry
     """
-    return dict(
-        type='text/json',
-        encoding='utf-8',
-        content=action_item,
-    )
+    global REGISTRY
+    if REGISTRY is None:
+        REGISTRY = ClowderRegistry(CLOWDERHOST, CLOWDERPORT)
+    return REGISTRY
 
 
-def start_connection(sel, host, port, request):
+def close_registry():
     """
-    Start the connection to the server
-    :param sel:
-    :param host:
-    :param port:
-    :param request:
+    Close the connection to the clowder
     :return:
     """
-    addr = (host, port)
-    # print(f'Starting connection to {addr}')
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.setblocking(False)
-    sock.connect_ex(addr)
-    events = selectors.EVENT_READ | selectors.EVENT_WRITE
-    message = ClientMessage(sel, sock, addr, request)
-    sel.register(sock, events, data=message)
+    global REGISTRY
+    if REGISTRY is not None:
+        REGISTRY.close()
+        REGISTRY = None
 
 
-def process_response(action, message):
+def get_results_store():
     """
-    process the response from the server
-    :param action:
-    :param message:
-    :return: port
+    Get the results store, kept open for all rounds
+    :return: ResultsStore, None if RESULTS_DB is empty
     """
-    try:
-        if action['action'] == 'QUERY':
-            bots_json = message.response
-            print(f'List of bots: {bots_json}')
-            bots = json.loads(bots_json.replace("'", '"'))
-            return bots
-        elif action['action'] in ['PLAY', 'DEFUSE']:
-            return message.response.decode('utf-8')
-    except Exception:
-        print(f'Error: {traceback.format_exc()}')
-        return None
+    global RESULTS_STORE
+    if RESULTS_STORE is None and RESULTS_DB:
+        RESULTS_STORE = ResultsStore(RESULTS_DB)
+    return RESULTS_STORE
 
 
-def log_game(botname: str, action: str, response: str) -> None:
+def close_results_store():
     """
-    Log the game actions
-    :param botname:
-    :param action:
-    :param response:
+    Close the results store
     :return:
     """
-    entry = {
-        'action': action,
-        'botname': botname,
-        'response': response,
-    }
-    line = f'{botname} / {action} / {response}'
-    logpath = LOGPATH
-    with open(f'{logpath}/{LOGFILE}.log', 'a') as logfile:
-        logfile.write(f'{line}\n')
-    with open(f'{logpath}/{LOGFILE}.json', 'a') as logfile:
-        logfile.write(f'{json.dumps(entry)}\n')
+    global RESULTS_STORE
+    if RESULTS_STORE is not None:
+        RESULTS_STORE.close()
+        RESULTS_STORE = None
+
 
 if __name__ == '__main__':
     main()
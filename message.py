@@ -1,8 +1,85 @@
-import io
+import functools
 import json
 import selectors
 import struct
 import sys
+import time
+
+import instrumentation
+from instrumentation import METRICS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class RecvBuffer:
+    """
+    Receive buffer filled with socket.recv_into and read through memoryviews.
+    Consumed bytes are not cut off; the unread tail is only moved to the
+    front when the free space at the end runs out.
+    """
+
+    def __init__(self, size=4096):
+        self._data = bytearray(size)
+        self._start = 0
+        self._end = 0
+        self.bytes_copied = 0
+
+    def recv_into(self, sock, size=4096):
+        """
+        receives up to size bytes from the socket into the free space
+        :param sock: the socket
+        :param size: the maximum number of bytes to receive
+        :return: the number of bytes received
+        """
+        self._reserve(size)
+        with memoryview(self._data) as view:
+            received = sock.recv_into(view[self._end:self._end + size], size)
+        self._end += received
+        return received
+
+    def view(self, size):
+        """
+        the next size bytes without copying them
+        :param size: the number of bytes
+        :return: memoryview, only valid until the next recv_into
+        """
+        return memoryview(self._data)[self._start:self._start + size]
+
+    def consume(self, size):
+        """
+        marks the next size bytes as read
+        :param size: the number of bytes
+        :return: None
+        """
+        self._start += size
+        if self._start == self._end:
+            self._start = self._end = 0
+
+    def _reserve(self, size):
+        """
+        makes room for size bytes at the end
+        :param size: the number of bytes
+        :return: None
+        """
+        if len(self._data) - self._end >= size:
+            return
+        unread = self._end - self._start
+        if len(self._data) - unread >= size:
+            # Move the unread tail to the front
+            self._data[:unread] = self._data[self._start:self._end]
+        else:
+            data = bytearray(max(2 * len(self._data), unread + size))
+            data[:unread] = self._data[self._start:self._end]
+            self._data = data
+        self.bytes_copied += unread
+        self._start = 0
+        self._end = unread
+
+    def __len__(self):
+        return self._end - self._start
 
 
 class Message:
@@ -14,7 +91,7 @@ class Message:
         self._socket = socket
         self._ipaddr = ipaddr
         self._event = ''
-        self._recv_buffer = b''
+        self._recv_buffer = RecvBuffer()
         self._send_buffer = b''
         self._request = None
         self._jsonheader_len = None
@@ -76,14 +153,12 @@ class Message:
         """
         try:
             # Should be ready to read
-            data = self._socket.recv(4096)
+            received = self._recv_buffer.recv_into(self._socket)
         except BlockingIOError:
             # Resource temporarily unavailable (errno EWOULDBLOCK)
             pass
         else:
-            if data:
-                self._recv_buffer += data
-            else:
+            if not received:
                 raise RuntimeError('Peer closed.')
 
     def _create_response_json_content(self):
@@ -119,15 +194,18 @@ class Message:
         :return:
         """
         if self._send_buffer:
-            print(f'Sending {self._send_buffer!r} to {self._ipaddr}')
+            if instrumentation.VERBOSITY >= 2:
+                print(f'Sending {bytes(self._send_buffer)!r} to {self._ipaddr}')
+            view = memoryview(self._send_buffer)
             try:
                 # Should be ready to write
-                sent = self._socket.send(self._send_buffer)
+                sent = self._socket.send(view)
             except BlockingIOError:
                 # Resource temporarily unavailable (errno EWOULDBLOCK)
                 pass
             else:
-                self._send_buffer = self._send_buffer[sent:]
+                # Keep a view on the rest instead of copying it
+                self._send_buffer = view[sent:] if sent < len(view) else b''
                 # Close when the buffer is drained. The response has been sent.
                 if type(self).__name__ == 'ServerMessage' and \
                         sent and \
@@ -142,9 +220,9 @@ class Message:
         hdrlen = 2
         if len(self._recv_buffer) >= hdrlen:
             self._jsonheader_len = struct.unpack(
-                '>H', self._recv_buffer[:hdrlen]
+                '>H', self._recv_buffer.view(hdrlen)
             )[0]
-            self._recv_buffer = self._recv_buffer[hdrlen:]
+            self._recv_buffer.consume(hdrlen)
 
     def _process_jsonheader(self):
         """
@@ -154,17 +232,10 @@ class Message:
         hdrlen = self._jsonheader_len
         if len(self._recv_buffer) >= hdrlen:
             self._jsonheader = json_decode(
-                self._recv_buffer[:hdrlen], 'utf-8'
+                self._recv_buffer.view(hdrlen), 'utf-8'
             )
-            self._recv_buffer = self._recv_buffer[hdrlen:]
-            for reqhdr in (
-                    'byteorder',
-                    'content-length',
-                    'content-type',
-                    'content-encoding',
-            ):
-                if reqhdr not in self._jsonheader:
-                    raise ValueError(f'Missing required header "{reqhdr}".')
+            self._recv_buffer.consume(hdrlen)
+            check_jsonheader(self._jsonheader)
 
     def _create_message(
             self,
@@ -180,23 +251,17 @@ class Message:
         :param content_encoding:
         :return:
         """
-
-        jsonheader = {
-            'byteorder': sys.byteorder,
-            'content-type': content_type,
-            'content-encoding': content_encoding,
-            'content-length': len(content_bytes),
-        }
-        jsonheader_bytes = json_encode(jsonheader, 'utf-8')
-        message_hdr = struct.pack('>H', len(jsonheader_bytes))
-
-        response_message = message_hdr + jsonheader_bytes + content_bytes
-        return response_message
+        return create_message(
+            content_bytes=content_bytes,
+            content_type=content_type,
+            content_encoding=content_encoding
+        )
 
     def close(self):
         #print(f'Closing connection to {self._ipaddr}')
         try:
-            self._selector.unregister(self._socket)
+            if self._selector.get_map().get(self._socket) is not None:
+                self._selector.unregister(self._socket)
         except Exception as e:
             print(
                 f'Error: selector.unregister() exception for '
@@ -240,6 +305,88 @@ class Message:
         self._response = value
 
 
+def create_message(*, content_bytes, content_type, content_encoding):
+    """
+    frames the content: 2-byte header length, json header, content
+    :param content_bytes: the encoded content
+    :param content_type: the content type, e.g. 'text/json'
+    :param content_encoding: the codec used for the content
+    :return: bytes
+    """
+    jsonheader_prefix = _jsonheader_prefix(content_type, content_encoding)
+    jsonheader_bytes = jsonheader_prefix + str(len(content_bytes)).encode('ascii') + b'}'
+    message_hdr = struct.pack('>H', len(jsonheader_bytes))
+
+    return message_hdr + jsonheader_bytes + content_bytes
+
+
+@functools.lru_cache(maxsize=32)
+def _jsonheader_prefix(content_type, content_encoding):
+    """
+    the json header up to the value of content-length, the same bytes json.dumps produces
+    :param content_type: the content type
+    :param content_encoding: the codec used for the content
+    :return: bytes
+    """
+    jsonheader = {
+        'byteorder': sys.byteorder,
+        'content-type': content_type,
+        'content-encoding': content_encoding,
+        'content-length': 0,
+    }
+    jsonheader_bytes = json.dumps(jsonheader, ensure_ascii=False).encode('utf-8')
+    # Cut off the placeholder '0}'
+    return jsonheader_bytes[:-2]
+
+
+def check_jsonheader(jsonheader):
+    """
+    checks that the json header has all required fields
+    :param jsonheader: the decoded json header
+    :return: None
+    """
+    for reqhdr in (
+            'byteorder',
+            'content-length',
+            'content-type',
+            'content-encoding',
+    ):
+        if reqhdr not in jsonheader:
+            raise ValueError(f'Missing required header "{reqhdr}".')
+
+
+def _std_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+def _std_loads(json_bytes):
+    return json.loads(str(json_bytes, 'utf-8'))
+
+
+JSON_CODECS = {
+    'json': (_std_dumps, _std_loads),
+}
+if orjson is not None:
+    JSON_CODECS['orjson'] = (orjson.dumps, orjson.loads)
+
+_json_codec = 'orjson' if 'orjson' in JSON_CODECS else 'json'
+
+
+def set_json_codec(name):
+    """
+    selects the json library for json_encode and json_decode
+    :param name: 'json', 'orjson' or 'auto' for the fastest one installed
+    :return: the name of the selected codec
+    """
+    global _json_codec
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in JSON_CODECS else 'json'
+    if name not in JSON_CODECS:
+        raise ValueError(f'JSON codec {name!r} is not available.')
+    _json_codec = name
+    return name
+
+
 def json_encode(obj, encoding):
     """
     encodes the object as json
@@ -247,19 +394,26 @@ def json_encode(obj, encoding):
     :param encoding: the codec to use for encoding
     :return: String
     """
-    return json.dumps(obj, ensure_ascii=False).encode(encoding)
+    started = time.perf_counter()
+    if encoding.lower() in ('utf-8', 'utf8'):
+        encoded = JSON_CODECS[_json_codec][0](obj)
+    else:
+        encoded = json.dumps(obj, ensure_ascii=False).encode(encoding)
+    METRICS.observe('codec.encode', time.perf_counter() - started)
+    return encoded
 
 
 def json_decode(json_bytes, encoding):
     """
     decodes json data into an object
-    :param json_bytes: the json data to be decoded
+    :param json_bytes: the json data to be decoded (bytes, bytearray or memoryview)
     :param encoding: the codec to use for decoding
     :return: Object
     """
-    text_io_wrap = io.TextIOWrapper(
-        io.BytesIO(json_bytes), encoding=encoding, newline=''
-    )
-    obj = json.load(text_io_wrap)
-    text_io_wrap.close()
-    return obj
+    started = time.perf_counter()
+    if encoding.lower() in ('utf-8', 'utf8'):
+        decoded = JSON_CODECS[_json_codec][1](json_bytes)
+    else:
+        decoded = json.loads(str(json_bytes, encoding))
+    METRICS.observe('codec.decode', time.perf_counter() - started)
+    return decoded
@@ -0,0 +1,152 @@
+""" Serves the tournament metrics in the Prometheus text format. """
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+from arena_driver import RoundResult
+from instrumentation import BUCKETS, Histogram
+
+
+class TournamentMetrics:
+    """
+    Adds up the RoundResults of a tournament. The supervisor records the
+    results, the HTTP thread renders them, so both go through a lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rounds = defaultdict(int)
+        self._turns = 0
+        self._round_seconds = 0.0
+        self._explosions = defaultdict(int)
+        self._disqualifications = defaultdict(int)
+        self._points = defaultdict(int)
+        self._wins = defaultdict(int)
+        self._failures = defaultdict(int)
+        self._latencies: Dict[str, Histogram] = defaultdict(Histogram)
+
+    def record(self, result: RoundResult) -> None:
+        """
+        Add a round.
+        :param result: the RoundResult
+        :return: None
+        """
+        with self._lock:
+            self._rounds['finished' if result.finished else 'cancelled'] += 1
+            self._turns += result.turns
+            self._round_seconds += result.duration
+            for name in result.exploded:
+                self._explosions[name] += 1
+            for name in result.disqualified:
+                self._disqualifications[name] += 1
+            for name, points in result.points.items():
+                self._points[name] += points
+            if result.finished and result.ranking:
+                self._wins[result.ranking[0]] += 1
+            for name, count in result.failures.items():
+                self._failures[name] += count
+            for name, histogram in result.latencies.items():
+                self._latencies[name].merge(histogram)
+
+    def render(self) -> str:
+        """
+        The metrics in the Prometheus text exposition format.
+        :return: str
+        """
+        lines = []
+
+        def metric(name: str, kind: str, text: str, samples) -> None:
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{labels} {value}')
+
+        def per_bot(values: dict):
+            return [(f'{{bot="{escape(name)}"}}', value) for name, value in sorted(values.items())]
+
+        with self._lock:
+            metric('kitten_rounds_total', 'counter', 'Rounds played by status.',
+                   [(f'{{status="{status}"}}', self._rounds[status]) for status in ('finished', 'cancelled')])
+            metric('kitten_turns_total', 'counter', 'Turns taken in all rounds.', [('', self._turns)])
+            metric('kitten_round_seconds_total', 'counter', 'Wall time of all rounds.',
+                   [('', self._round_seconds)])
+            turns_per_second = self._turns / self._round_seconds if self._round_seconds else 0.0
+            metric('kitten_turns_per_second', 'gauge', 'Turns per second of round wall time.',
+                   [('', turns_per_second)])
+            metric('kitten_explosions_total', 'counter', 'Exploded bots, disqualified ones included.',
+                   per_bot(self._explosions))
+            metric('kitten_disqualifications_total', 'counter', 'Bots that played a card they did not have.',
+                   per_bot(self._disqualifications))
+            metric('kitten_ranking_points_total', 'counter', 'Ranking points from Arena.bot_ranking_points.',
+                   per_bot(self._points))
+            metric('kitten_wins_total', 'counter', 'Rounds won.', per_bot(self._wins))
+            metric('kitten_bot_failures_total', 'counter', 'Requests that timed out or failed.',
+                   per_bot(self._failures))
+
+            lines.append('# HELP kitten_request_seconds Latency of the requests to a bot.')
+            lines.append('# TYPE kitten_request_seconds histogram')
+            for name, histogram in sorted(self._latencies.items()):
+                bot = escape(name)
+                cumulative = 0
+                for bucket in range(BUCKETS - 1):
+                    cumulative += histogram.buckets[bucket]
+                    lines.append(f'kitten_request_seconds_bucket{{bot="{bot}",le="{2 ** bucket / 1e6:g}"}} '
+                                 f'{cumulative}')
+                lines.append(f'kitten_request_seconds_bucket{{bot="{bot}",le="+Inf"}} {histogram.count}')
+                lines.append(f'kitten_request_seconds_sum{{bot="{bot}"}} {histogram.total}')
+                lines.append(f'kitten_request_seconds_count{{bot="{bot}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value: str) -> str:
+    """ escapes a label value """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsServer:
+    """
+    A local HTTP server answering GET /metrics from a daemon thread.
+    """
+
+    def __init__(self, metrics: TournamentMetrics, host: str, port: int):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='MetricsServer', daemon=True)
+
+    def start(self) -> None:
+        """
+        Start answering requests.
+        :return: None
+        """
+        self._thread.start()
+        host, port = self._server.server_address[:2]
+        print(f'Metrics: http://{host}:{port}/metrics')
+
+    def stop(self) -> None:
+        """
+        Stop the server.
+        :return: None
+        """
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def port(self) -> int:
+        """ returns the port the server listens on """
+        return self._server.server_address[1]
@@ -0,0 +1,206 @@
+""" Replays a logged round from its seed and the recorded answers of the bots. """
+import argparse
+import cProfile
+import json
+import pstats
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Tuple
+
+from binary_log import BinaryLogReader
+from game.arena import Arena
+
+GAME_EVENTS = ('DRAW', 'PLAY', 'DEFUSE', 'EXPLODE', 'FUTURE')
+RANK = re.compile(r'^\d+\.$')
+
+
+class ReplayError(Exception):
+    """ The replayed round differs from the log. """
+
+
+@dataclass
+class RecordedRound:
+    seed: int
+    bots: List[str]
+    # The answers to PLAY and DEFUSE as (botname, action, response), in order
+    responses: List[Tuple[str, str, object]] = field(default_factory=list)
+    # DRAW, PLAY, DEFUSE, EXPLODE and FUTURE as the driver logged them
+    events: List[Tuple[str, str, object]] = field(default_factory=list)
+    # The ranking lines: ('1.', botname, 'N Punkte')
+    ranking: List[Tuple[str, str, object]] = field(default_factory=list)
+
+
+@dataclass
+class ReplayResult:
+    events: List[Tuple[str, str, object]]
+    ranking: List[Tuple[str, str, object]]
+    turns: int
+    finished: bool
+
+
+def read_events(path: str) -> Iterator[Tuple[str, str, object]]:
+    """
+    Read the events of a .json or .klog game log.
+    :param path: the game log
+    :return: iterator of (botname, action, response)
+    """
+    if path.endswith('.klog'):
+        reader = BinaryLogReader(path)
+        try:
+            yield from reader
+        finally:
+            reader.close()
+        return
+    with open(path) as logfile:
+        for line in logfile:
+            if line.strip():
+                entry = json.loads(line)
+                yield entry['botname'], entry['action'], entry['response']
+
+
+def load_round(path: str) -> RecordedRound:
+    """
+    Collect what a replay needs from a game log.
+    :param path: the .json or .klog game log of one round
+    :return: RecordedRound
+    """
+    recorded = None
+    for botname, action, response in read_events(path):
+        if botname == 'Game' and action == 'SEED':
+            if recorded is not None:
+                raise ReplayError(f'{path} holds more than one round.')
+            recorded = RecordedRound(int(response), [])
+        elif recorded is None:
+            continue
+        elif botname == 'Game' and action == 'START':
+            recorded.bots = response.split(',')
+        elif RANK.match(str(botname)):
+            recorded.ranking.append((botname, action, response))
+        elif botname != 'Game' and action in GAME_EVENTS:
+            recorded.events.append((botname, action, response))
+            if action in ('PLAY', 'DEFUSE'):
+                recorded.responses.append((botname, action, response))
+    if recorded is None:
+        raise ReplayError(f'{path} has no SEED, it was logged before rounds were seeded.')
+    return recorded
+
+
+def replay(recorded: RecordedRound, check: bool = True) -> ReplayResult:
+    """
+    Play the round again on the arena, answering for the bots with the recorded responses.
+    :param recorded: the RecordedRound
+    :param check: raise ReplayError where the replay differs from the log
+    :return: ReplayResult with the events as the driver would log them
+    """
+    bots = recorded.bots
+    arena = Arena(verbose=False, rng=random.Random(recorded.seed))
+    arena.start_round(len(bots))
+    events = []
+    for bot_number, botname in enumerate(bots):
+        for card in arena.read_hand(bot_number):
+            events.append((botname, 'DRAW', card))
+
+    responses = iter(recorded.responses)
+    alive_count = len(bots)
+    turns = 0
+    while alive_count > 1:
+        bot_number, action, data = arena.take_turn()
+        botname = bots[bot_number]
+        response = None
+        if action in ('PLAY', 'DEFUSE'):
+            recorded_response = next(responses, None)
+            if recorded_response is None:
+                # The log ends here, the round was cancelled
+                break
+            if check and recorded_response[:2] != (botname, action):
+                raise ReplayError(f'Turn {turns}: the arena asks {botname} to {action}, '
+                                  f'the log has {recorded_response[:2]}.')
+            response = recorded_response[2]
+            events.append((botname, action, response))
+        elif action in ('DRAW', 'EXPLODE', 'FUTURE'):
+            events.append((botname, action, data))
+            if action == 'EXPLODE':
+                alive_count -= 1
+        turns += 1
+        arena.analyze_turn(response)
+
+    finished = alive_count <= 1
+    ranking = []
+    if finished:
+        points = arena.bot_ranking_points
+        for rank, bot_number in enumerate(arena.ranking, start=1):
+            ranking.append((f'{rank}.', bots[bot_number], f'{points[bot_number]} Punkte'))
+
+    result = ReplayResult(events, ranking, turns, finished)
+    if check:
+        compare(recorded, result)
+    return result
+
+
+def compare(recorded: RecordedRound, result: ReplayResult) -> None:
+    """
+    Check that the replay logged the same events and ranking.
+    :param recorded: the RecordedRound
+    :param result: the ReplayResult
+    :return: None
+    """
+    for number, (logged, replayed) in enumerate(zip(recorded.events, result.events)):
+        if list(logged) != list(replayed):
+            raise ReplayError(f'Event {number}: the log has {logged}, the replay {replayed}.')
+    if result.finished and len(recorded.events) != len(result.events):
+        raise ReplayError(f'The log has {len(recorded.events)} events, the replay {len(result.events)}.')
+    if result.finished and [list(line) for line in recorded.ranking] != [list(line) for line in result.ranking]:
+        raise ReplayError(f'The log ranks {recorded.ranking}, the replay {result.ranking}.')
+
+
+def benchmark(recorded: RecordedRound, repeat: int) -> Dict[str, float]:
+    """
+    Replay the round repeat times without checking.
+    :param recorded: the RecordedRound
+    :param repeat: the number of replays
+    :return: dict with seconds, turns and turns per second
+    """
+    turns = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        turns += replay(recorded, check=False).turns
+    seconds = time.perf_counter() - started
+    return {'seconds': seconds, 'turns': turns, 'turns_per_second': turns / seconds if seconds else 0.0}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay logged rounds without the bots.')
+    parser.add_argument('logs', nargs='+', help='.json or .klog game logs')
+    parser.add_argument('--repeat', type=int, default=0, help='replay each round this many times and time it')
+    parser.add_argument('--profile', action='store_true', help='profile the repeated replays')
+    args = parser.parse_args()
+
+    failed = False
+    for log in args.logs:
+        try:
+            recorded_round = load_round(log)
+            replayed = replay(recorded_round)
+        except ReplayError as e:
+            print(f'{log}: MISMATCH {e}')
+            failed = True
+            continue
+        except ValueError as e:
+            print(f'{log}: UNREADABLE {e}')
+            failed = True
+            continue
+        status = 'finished' if replayed.finished else 'cancelled'
+        print(f'{log}: ok, seed {recorded_round.seed}, {replayed.turns} turns, {status}')
+        if args.repeat:
+            if args.profile:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                stats = benchmark(recorded_round, args.repeat)
+                profiler.disable()
+                pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+            else:
+                stats = benchmark(recorded_round, args.repeat)
+            print(f'  {args.repeat} replays, {stats["turns"]} turns in {stats["seconds"]:.3f}s '
+                  f'({stats["turns_per_second"]:,.0f} turns per second)')
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,194 @@
+""" Keeps the results of all rounds and the leaderboard in one SQLite file. """
+import argparse
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import List
+
+from arena_driver import RoundResult
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS rounds (
+    id INTEGER PRIMARY KEY,
+    recorded REAL NOT NULL,
+    logfile TEXT NOT NULL,
+    round_number INTEGER NOT NULL,
+    deal INTEGER,
+    seed INTEGER,
+    finished INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    turns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS placements (
+    round_id INTEGER NOT NULL REFERENCES rounds (id),
+    bot TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    points INTEGER NOT NULL,
+    disqualified INTEGER NOT NULL,
+    reason TEXT,
+    PRIMARY KEY (round_id, bot)
+);
+CREATE INDEX IF NOT EXISTS placements_bot ON placements (bot);
+CREATE TABLE IF NOT EXISTS leaderboard (
+    bot TEXT PRIMARY KEY,
+    rounds INTEGER NOT NULL,
+    wins INTEGER NOT NULL,
+    points INTEGER NOT NULL,
+    explosions INTEGER NOT NULL,
+    disqualifications INTEGER NOT NULL,
+    last_round INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS rounds_no_update BEFORE UPDATE ON rounds
+    BEGIN SELECT RAISE(ABORT, 'rounds are append-only'); END;
+CREATE TRIGGER IF NOT EXISTS rounds_no_delete BEFORE DELETE ON rounds
+    BEGIN SELECT RAISE(ABORT, 'rounds are append-only'); END;
+CREATE TRIGGER IF NOT EXISTS placements_no_update BEFORE UPDATE ON placements
+    BEGIN SELECT RAISE(ABORT, 'placements are append-only'); END;
+CREATE TRIGGER IF NOT EXISTS placements_no_delete BEFORE DELETE ON placements
+    BEGIN SELECT RAISE(ABORT, 'placements are append-only'); END;
+'''
+
+UPSERT_LEADERBOARD = '''
+INSERT INTO leaderboard (bot, rounds, wins, points, explosions, disqualifications, last_round)
+VALUES (:bot, 1, :win, :points, :exploded, :disqualified, :round_id)
+ON CONFLICT (bot) DO UPDATE SET
+    rounds = rounds + 1,
+    wins = wins + excluded.wins,
+    points = points + excluded.points,
+    explosions = explosions + excluded.explosions,
+    disqualifications = disqualifications + excluded.disqualifications,
+    last_round = excluded.last_round
+'''
+
+
+@dataclass
+class LeaderboardEntry:
+    bot: str
+    rounds: int
+    wins: int
+    points: int
+    explosions: int
+    disqualifications: int
+
+    @property
+    def mean(self) -> float:
+        """ returns the mean points per round """
+        return self.points / self.rounds if self.rounds else 0.0
+
+
+class ResultsStore:
+    """
+    An append-only store of the rounds and the placements of the bots.
+    The leaderboard is updated in the same transaction as each round,
+    so reading the standings never scans the rounds.
+    """
+
+    def __init__(self, path: str, timeout: float = 10.0):
+        """
+        :param path: the SQLite file, created if missing
+        :param timeout: seconds to wait for another writer
+        """
+        self._path = path
+        self._connection = sqlite3.connect(path, timeout=timeout)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(SCHEMA)
+
+    def add_round(self, result: RoundResult) -> int:
+        """
+        Append a round and add its placements to the leaderboard.
+        Cancelled rounds are kept without placements.
+        :param result: the RoundResult
+        :return: the id of the round in the store
+        """
+        with self._connection:
+            cursor = self._connection.execute(
+                'INSERT INTO rounds (recorded, logfile, round_number, deal, seed, finished, duration, turns) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (time.time(), result.logfile, result.round_number, result.deal, result.seed,
+                 int(result.finished), result.duration, result.turns))
+            round_id = cursor.lastrowid
+            if not result.finished:
+                return round_id
+            placements = []
+            for rank, bot in enumerate(result.ranking, start=1):
+                placements.append({
+                    'round_id': round_id,
+                    'bot': bot,
+                    'rank': rank,
+                    'points': result.points.get(bot, 0),
+                    'win': int(rank == 1),
+                    'exploded': int(bot in result.reasons),
+                    'disqualified': int(bot in result.disqualified),
+                    'reason': result.reasons.get(bot),
+                })
+            self._connection.executemany(
+                'INSERT INTO placements (round_id, bot, rank, points, disqualified, reason) '
+                'VALUES (:round_id, :bot, :rank, :points, :disqualified, :reason)', placements)
+            self._connection.executemany(UPSERT_LEADERBOARD, placements)
+        return round_id
+
+    def leaderboard(self, limit: int = None) -> List[LeaderboardEntry]:
+        """
+        The standings, best mean points first.
+        :param limit: the number of bots, all if None
+        :return: list of LeaderboardEntry
+        """
+        rows = self._connection.execute(
+            'SELECT bot, rounds, wins, points, explosions, disqualifications FROM leaderboard '
+            'ORDER BY CAST(points AS REAL) / rounds DESC, wins DESC LIMIT ?',
+            (-1 if limit is None else limit,))
+        return [LeaderboardEntry(*row) for row in rows]
+
+    def rebuild_leaderboard(self) -> None:
+        """
+        Recompute the leaderboard from the placements.
+        :return: None
+        """
+        with self._connection:
+            self._connection.execute('DELETE FROM leaderboard')
+            self._connection.execute(
+                'INSERT INTO leaderboard (bot, rounds, wins, points, explosions, disqualifications, last_round) '
+                'SELECT bot, COUNT(*), SUM(rank = 1), SUM(points), SUM(reason IS NOT NULL), SUM(disqualified), '
+                'MAX(round_id) FROM placements GROUP BY bot')
+
+    def rounds(self) -> int:
+        """ returns the number of rounds in the store, cancelled ones included """
+        return self._connection.execute('SELECT COUNT(*) FROM rounds').fetchone()[0]
+
+    def close(self) -> None:
+        """
+        Close the database.
+        :return: None
+        """
+        self._connection.close()
+
+
+def format_leaderboard(entries: List[LeaderboardEntry]) -> str:
+    """
+    The leaderboard as a text table.
+    :param entries: the LeaderboardEntry list
+    :return: str
+    """
+    lines = [f'{"":>5}{"Bot":<23}{"Rounds":>8}{"Wins":>8}{"Points":>9}{"Mean":>8}{"Exploded":>10}{"Disq.":>7}']
+    for rank, entry in enumerate(entries, start=1):
+        lines.append(f'{f"{rank}.":>4} {entry.bot:<23}{entry.rounds:>8}{entry.wins:>8}{entry.points:>9}'
+                     f'{entry.mean:>8.2f}{entry.explosions:>10}{entry.disqualifications:>7}')
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Show the leaderboard of the results store.')
+    parser.add_argument('database', help='the SQLite results store')
+    parser.add_argument('--top', type=int, default=None, help='show only the best bots')
+    parser.add_argument('--rebuild', action='store_true', help='recompute the leaderboard from the placements')
+    args = parser.parse_args()
+
+    store = ResultsStore(args.database)
+    try:
+        if args.rebuild:
+            store.rebuild_leaderboard()
+        print(f'{store.rounds()} rounds')
+        print(format_leaderboard(store.leaderboard(args.top)))
+    finally:
+        store.close()
@@ -0,0 +1,74 @@
+""" Reads the configuration from the environment or a .env file. """
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds a round may take before it is cancelled
+ROUND_DEADLINE = float(os.getenv('ROUND_DEADLINE', 240))
+# Seconds the supervisor waits past the deadline before it kills the round process
+ROUND_GRACE = float(os.getenv('ROUND_GRACE', 10))
+# Minimum seconds between the start of two rounds
+ROUND_COOLDOWN = float(os.getenv('ROUND_COOLDOWN', 300))
+
+# The game log is flushed after this many events or seconds, and at the end of the round
+LOG_FLUSH_SIZE = int(os.getenv('LOG_FLUSH_SIZE', 64))
+LOG_FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', 1.0))
+# Events waiting for the writer thread before the game has to wait
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 4096))
+# When to fsync the game log: never, flush (every flush) or close (end of round)
+LOG_FSYNC = os.getenv('LOG_FSYNC', 'close')
+# The game log files to write: text (.log), json (.json), binary (.klog)
+LOG_FORMATS = tuple(os.getenv('LOG_FORMATS', 'text,json').split(','))
+
+# The json library for message frames: json, orjson or auto (orjson if installed)
+JSON_CODEC = os.getenv('JSON_CODEC', 'auto')
+# The wire protocols the arena offers the bots at START: text/json and kitten/2 (binary_protocol.py)
+WIRE_PROTOCOLS = tuple(os.getenv('WIRE_PROTOCOLS', 'text/json,kitten/2').split(','))
+
+# Seconds the bot list of the clowder is cached between rounds
+CLOWDER_TTL = float(os.getenv('CLOWDER_TTL', 60))
+# Seconds to wait for the clowder before the cached bot list is used
+CLOWDER_TIMEOUT = float(os.getenv('CLOWDER_TIMEOUT', 5))
+# Bots that failed this many rounds in a row are left out for CLOWDER_RETRY_AFTER seconds
+CLOWDER_MAX_FAILURES = int(os.getenv('CLOWDER_MAX_FAILURES', 3))
+CLOWDER_RETRY_AFTER = float(os.getenv('CLOWDER_RETRY_AFTER', 900))
+
+# Before each round every bot gets PROBE_COUNT connects of at most PROBE_TIMEOUT seconds, bots
+# that accept none sit out
+PROBE_COUNT = int(os.getenv('PROBE_COUNT', 3))
+PROBE_TIMEOUT = float(os.getenv('PROBE_TIMEOUT', 2.0))
+# Bots above these answer latencies (seconds, over their last PROBE_HISTORY requests in rounds, timeouts
+# included) sit out for CLOWDER_RETRY_AFTER seconds, 0 for no limit
+PROBE_MAX_P50 = float(os.getenv('PROBE_MAX_P50', 0.5))
+PROBE_MAX_P99 = float(os.getenv('PROBE_MAX_P99', 1.5))
+PROBE_HISTORY = int(os.getenv('PROBE_HISTORY', 1000))
+
+# Seconds a bot may take to answer PLAY, DEFUSE and all other requests (acknowledgements)
+TIMEOUT_PLAY = float(os.getenv('TIMEOUT_PLAY', 10))
+TIMEOUT_DEFUSE = float(os.getenv('TIMEOUT_DEFUSE', 10))
+TIMEOUT_ACK = float(os.getenv('TIMEOUT_ACK', 5))
+# Seconds a bot may spend answering during a whole round, 0 for no budget
+BOT_TIME_BUDGET = float(os.getenv('BOT_TIME_BUDGET', 0))
+
+# What is printed: 0 errors and results, 1 every turn of the game, 2 every message
+VERBOSITY = int(os.getenv('VERBOSITY', 1))
+
+# Port of the local Prometheus metrics endpoint (/metrics), 0 to turn it off
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Deal every round from this seed (to play the same deal against other bots), a fresh seed per round if empty
+ROUND_SEED = int(os.getenv('ROUND_SEED')) if os.getenv('ROUND_SEED') else None
+# Confidence level of the intervals in the standings
+STANDINGS_CONFIDENCE = float(os.getenv('STANDINGS_CONFIDENCE', 0.95))
+# Tournaments stop before the number of rounds asked for once every bot has played this many rounds (deals)
+# and the confidence intervals of neighbours in the standings don't overlap, 0 to always play all rounds
+TOURNAMENT_MIN_ROUNDS = int(os.getenv('TOURNAMENT_MIN_ROUNDS', 20))
+# If set, the standings are saved to this file after every round, so an interrupted tournament
+# with the same bots, rounds and seed resumes; empty (the default) for no checkpoint
+TOURNAMENT_CHECKPOINT = os.getenv('TOURNAMENT_CHECKPOINT', '')
+
+# If set, the SQLite file keeping the results of all rounds and the leaderboard; empty (the default) for none
+RESULTS_DB = os.getenv('RESULTS_DB', '')
@@ -0,0 +1,223 @@
+""" Running means and confidence intervals of the ranking points. """
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Dict, List, Set, Tuple
+
+from arena_driver import RoundResult
+
+
+@dataclass
+class BotStanding:
+    name: str
+    samples: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+
+    def add(self, value: float) -> None:
+        """ adds one sample (Welford's running mean and variance) """
+        self.samples += 1
+        delta = value - self.mean
+        self.mean += delta / self.samples
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self) -> float:
+        """ returns the sample variance, inf with fewer than two samples """
+        return self.m2 / (self.samples - 1) if self.samples > 1 else math.inf
+
+    @property
+    def stderr(self) -> float:
+        """ returns the standard error of the mean """
+        return math.sqrt(self.variance / self.samples) if self.samples > 1 else math.inf
+
+
+class Standings:
+    """
+    Mean ranking points per bot with a normal confidence interval.
+    Every finished round is one sample per bot that played it.
+    """
+
+    def __init__(self, confidence: float = 0.95):
+        self._confidence = confidence
+        self._z = NormalDist().inv_cdf((1 + confidence) / 2)
+        self._bots: Dict[str, BotStanding] = {}
+        self._rounds = 0
+        self._played = 0
+
+    def add_round(self, result: RoundResult) -> None:
+        """
+        Add the points of a round.
+        :param result: the RoundResult, cancelled rounds are left out
+        :return: None
+        """
+        self._played += 1
+        if not result.finished:
+            return
+        self._rounds += 1
+        for name, points in result.points.items():
+            self.add_sample(name, points)
+
+    def add_sample(self, name: str, value: float) -> None:
+        """
+        Add one sample of a bot.
+        :param name: the bot name
+        :param value: the points
+        :return: None
+        """
+        standing = self._bots.get(name)
+        if standing is None:
+            standing = self._bots[name] = BotStanding(name)
+        standing.add(value)
+
+    def interval(self, name: str) -> Tuple[float, float]:
+        """
+        The confidence interval of the mean points of a bot.
+        :param name: the bot name
+        :return: (low, high)
+        """
+        standing = self._bots[name]
+        half_width = self._z * standing.stderr
+        return standing.mean - half_width, standing.mean + half_width
+
+    def converged(self, min_samples: int) -> bool:
+        """
+        Whether the ranking is settled: every bot has min_samples samples and
+        the intervals of bots next to each other in the table don't overlap.
+        :param min_samples: the samples each bot needs at least
+        :return: bool
+        """
+        table = self.table()
+        if len(table) < 2 or any(standing.samples < max(2, min_samples) for standing in table):
+            return False
+        return all(self.interval(better.name)[0] > self.interval(worse.name)[1]
+                   for better, worse in zip(table, table[1:]))
+
+    def table(self) -> List[BotStanding]:
+        """ returns the standings, best mean first """
+        return sorted(self._bots.values(), key=lambda standing: standing.mean, reverse=True)
+
+    def format(self, title: str = 'Standings') -> str:
+        """
+        The standings as a text table.
+        :param title: the first line
+        :return: str
+        """
+        lines = [f'{title} ({self._rounds} rounds, {self._confidence:.0%} confidence)',
+                 f'{"Bot":<24}{"Samples":>8}{"Mean":>9}{"Interval":>20}']
+        for standing in self.table():
+            low, high = self.interval(standing.name)
+            lines.append(f'{standing.name:<24}{standing.samples:>8}{standing.mean:>9.2f}'
+                         f'{f"{low:.2f} .. {high:.2f}":>20}')
+        return '\n'.join(lines)
+
+    def state(self) -> dict:
+        """ returns the standings as a dict of json types, see restore """
+        return {
+            'rounds': self._rounds,
+            'played': self._played,
+            'bots': {name: [standing.samples, standing.mean, standing.m2] for name, standing in self._bots.items()},
+        }
+
+    def restore(self, state: dict) -> None:
+        """
+        Continue from a saved state.
+        :param state: the result of state
+        :return: None
+        """
+        self._rounds = state['rounds']
+        self._played = state['played']
+        self._bots = {name: BotStanding(name, *values) for name, values in state['bots'].items()}
+
+    @property
+    def rounds(self) -> int:
+        """ returns the number of finished rounds added """
+        return self._rounds
+
+    @property
+    def played(self) -> int:
+        """ returns the number of rounds added, cancelled ones included """
+        return self._played
+
+    @property
+    def confidence(self) -> float:
+        """ returns the confidence level of the intervals """
+        return self._confidence
+
+
+class DuplicateStandings(Standings):
+    """
+    Standings of a duplicate tournament: every deal is played once per
+    seat rotation, and a bot's sample is its mean over the rotations of a
+    deal, so the luck of the deal cancels out. Deals with a cancelled
+    rotation are left out.
+    """
+
+    def __init__(self, rotations: int, confidence: float = 0.95):
+        super().__init__(confidence)
+        self._rotations = rotations
+        self._deals = defaultdict(list)
+        self._complete = 0
+        self._dropped = 0
+        self._done: Set[int] = set()
+
+    def add_round(self, result: RoundResult) -> None:
+        """
+        Add a rotation, and the deal once all its rotations are in.
+        :param result: the RoundResult with deal set
+        :return: None
+        """
+        self._rounds += result.finished
+        rotations = self._deals[result.deal]
+        rotations.append(result)
+        if len(rotations) < self._rotations:
+            return
+        del self._deals[result.deal]
+        self._done.add(result.deal)
+        if not all(rotation.finished for rotation in rotations):
+            self._dropped += 1
+            return
+        self._complete += 1
+        totals = defaultdict(int)
+        for rotation in rotations:
+            for name, points in rotation.points.items():
+                totals[name] += points
+        for name, total in totals.items():
+            self.add_sample(name, total / self._rotations)
+
+    def format(self, title: str = 'Duplicate standings') -> str:
+        dropped = f', {self._dropped} deals dropped' if self._dropped else ''
+        return f'{super().format(title)}\n{self._complete} deals of {self._rotations} rotations{dropped}'
+
+    def state(self) -> dict:
+        """ returns the standings of the done deals, the rotations of unfinished deals are left out """
+        state = super().state()
+        state['rounds'] -= sum(rotation.finished for rotations in self._deals.values() for rotation in rotations)
+        state.update(rotations=self._rotations, complete=self._complete, dropped=self._dropped,
+                     done=sorted(self._done))
+        return state
+
+    def restore(self, state: dict) -> None:
+        if state['rotations'] != self._rotations:
+            raise ValueError(f'the deals were played in {state["rotations"]} rotations, not {self._rotations}')
+        super().restore(state)
+        self._complete = state['complete']
+        self._dropped = state['dropped']
+        self._done = set(state['done'])
+        self._deals.clear()
+
+    @property
+    def deals(self) -> int:
+        """ returns the number of complete deals """
+        return self._complete
+
+    @property
+    def played(self) -> int:
+        """ returns the number of done deals, dropped ones included """
+        return len(self._done)
+
+    @property
+    def done(self) -> Set[int]:
+        """ returns the numbers of the done deals """
+        return self._done
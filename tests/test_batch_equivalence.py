@@ -0,0 +1,28 @@
+""" The batch simulator plays the same games as game.arena.Arena. """
+import pytest
+
+pytest.importorskip('numpy')
+
+from game.batch import MAX_Z, TABLE_POLICIES, compare_statistics, simulate_batch  # noqa: E402
+
+GAMES = 2000
+
+
+@pytest.mark.parametrize('policy_names, seed', [
+    (['random', 'random'], 1),
+    (['passive', 'skipper', 'hoarder'], 2),
+    (['random', 'skipper', 'hoarder', 'passive'], 3),
+    (['skipper', 'hoarder', 'random', 'skipper', 'hoarder'], 4),
+])
+def test_statistics_agree_with_arena(policy_names, seed):
+    for label, arena_mean, batch_mean, distance in compare_statistics(policy_names, GAMES, seed):
+        assert distance < MAX_Z, f'{label}: arena {arena_mean:.3f}, batch {batch_mean:.3f}, z {distance:.2f}'
+
+
+def test_same_seed_same_games():
+    policies = [TABLE_POLICIES['random'], TABLE_POLICIES['skipper'], TABLE_POLICIES['hoarder']]
+    first = simulate_batch(policies, 200, seed=5)
+    second = simulate_batch(policies, 200, seed=5)
+    assert (first.points == second.points).all()
+    assert (first.turns == second.turns).all()
+
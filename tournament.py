@@ -0,0 +1,166 @@
+""" Runs many rounds in parallel on a pool of worker processes. """
+import asyncio
+import random
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Iterator, List, Optional, Set
+
+from arena_driver import RoundResult, new_seed, run_round
+from game_log import GameLog
+
+
+def run_tournament(
+        rounds: int,
+        workers: int,
+        request_bots: Callable[[], List[dict]],
+        logpath: str,
+        logprefix: str,
+        deadline: float,
+        seed: int = None,
+        first_round: int = 0,
+        stop: Callable[[], bool] = None
+) -> Iterator[RoundResult]:
+    """
+    Run the rounds on a pool of worker processes and yield each result as soon as it is done.
+    A bot keeps the state of one hand, so it can't sit at two tables at once:
+    the bots are split into one disjoint set per worker, and each table
+    plays all its rounds with its set.
+    :param rounds: the number of rounds to play
+    :param workers: the most worker processes, one per table
+    :param request_bots: returns the bot list, called once in this process
+    :param logpath: the directory for the game logs
+    :param logprefix: the prefix of the logfile names, the round number is appended
+    :param deadline: seconds a round may take before it is cancelled
+    :param seed: deal every round from this seed, a fresh seed per round if None
+    :param first_round: the number of the first round, to continue a tournament
+    :param stop: returns True to start no more rounds, the rounds in flight still finish
+    :return: iterator of RoundResult in the order the rounds finish
+    """
+    tables = split_bots(request_bots(), workers)
+    if not tables:
+        print('Tournament skipped, fewer than 2 bots for a table.')
+        return
+    next_round = first_round
+
+    def next_job(table: int) -> Optional[tuple]:
+        nonlocal next_round
+        if next_round >= first_round + rounds or (stop and stop()):
+            return None
+        job = (next_round, tables[table], logpath, f'{logprefix}_{next_round:05d}', deadline, seed, None)
+        next_round += 1
+        return job
+
+    yield from _run_pool(len(tables), next_job)
+
+
+def run_duplicate(
+        deals: int,
+        request_bots: Callable[[], List[dict]],
+        logpath: str,
+        logprefix: str,
+        deadline: float,
+        seed: int = None,
+        done: Set[int] = frozenset(),
+        stop: Callable[[], bool] = None
+) -> Iterator[RoundResult]:
+    """
+    Play every deal once per seat rotation of the same bots, like duplicate bridge,
+    so each bot gets each seat of each deal. The bots are requested once.
+    Every rotation seats the same bot processes, which keep the state of one
+    hand, so the rounds are played one after another on a single worker.
+    :param deals: the number of deals
+    :param request_bots: returns the bot list, called once in this process
+    :param logpath: the directory for the game logs
+    :param logprefix: the prefix of the logfile names, the deal and rotation are appended
+    :param deadline: seconds a round may take before it is cancelled
+    :param seed: draw the seeds of the deals from this seed, fresh seeds if None
+    :param done: the deals played before, to continue a tournament with the same seed
+    :param stop: returns True to start no more deals, the deals in flight still finish
+    :return: iterator of RoundResult with deal set, in the order they are played
+    """
+    bot_list = request_bots()
+    rng = random.Random(seed) if seed is not None else None
+    rotations = len(bot_list)
+    jobs = []
+    for deal in range(deals):
+        deal_seed = rng.getrandbits(63) if rng else new_seed()
+        if deal in done:
+            continue
+        for rotation in range(rotations):
+            seats = bot_list[rotation:] + bot_list[:rotation]
+            logfile = f'{logprefix}_{deal:05d}_{rotation:02d}'
+            jobs.append((deal * rotations + rotation, seats, logpath, logfile, deadline, deal_seed, deal))
+    pending = iter(jobs)
+
+    def next_job(table: int) -> Optional[tuple]:
+        nonlocal pending
+        job = next(pending, None)
+        # Stop between deals only, a deal counts once all its rotations are played
+        if job is not None and job[0] % rotations == 0 and stop and stop():
+            pending = iter(())
+            return None
+        return job
+
+    yield from _run_pool(1, next_job)
+
+
+def _run_pool(tables: int, next_job: Callable[[int], Optional[tuple]]) -> Iterator[RoundResult]:
+    """
+    Keep one round per table in flight on a pool of worker processes.
+    :param tables: the number of tables, one worker process each
+    :param next_job: returns the play_round arguments of the next round at a table, None when done
+    :return: iterator of RoundResult in the order the rounds finish
+    """
+    with ProcessPoolExecutor(max_workers=tables) as executor:
+        in_flight = {}
+
+        def submit(table: int) -> None:
+            job = next_job(table)
+            if job is not None:
+                in_flight[executor.submit(play_round, *job)] = (table, job)
+
+        for table in range(tables):
+            submit(table)
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                table, job = in_flight.pop(future)
+                round_number, logfile, deal = job[0], job[3], job[6]
+                try:
+                    result = future.result()
+                except Exception:
+                    print(f'Error in round {round_number}:\n{traceback.format_exc()}')
+                    result = RoundResult(logfile, round_number=round_number, deal=deal)
+                submit(table)
+                yield result
+
+
+def play_round(round_number: int, bot_list: List[dict], logpath: str, logfile: str,
+               deadline: float, seed: int = None, deal: int = None) -> RoundResult:
+    """
+    Play one round in a worker process.
+    :param round_number: the number of the round in the tournament
+    :param bot_list: the bots playing this round
+    :param logpath: the directory for the game log
+    :param logfile: the name of the game log without extension
+    :param deadline: seconds the round may take before it is cancelled
+    :param seed: the seed of the deck, a fresh one if None
+    :param deal: the deal of a duplicate tournament
+    :return: the RoundResult
+    """
+    result = asyncio.run(run_round(bot_list, GameLog(logpath, logfile), deadline, seed))
+    result.round_number = round_number
+    result.deal = deal
+    return result
+
+
+def split_bots(bot_list: List[dict], tables: int) -> List[List[dict]]:
+    """
+    Split the bots into disjoint sets, each with at least two bots.
+    :param bot_list: all bots
+    :param tables: the wanted number of sets
+    :return: list of bot lists, empty if there are fewer than two bots
+    """
+    tables = max(1, min(tables, len(bot_list) // 2))
+    return [seats for seats in (bot_list[table::tables] for table in range(tables)) if len(seats) >= 2]
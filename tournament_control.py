@@ -0,0 +1,125 @@
+""" Stops a tournament once its ranking is settled and saves checkpoints to resume it. """
+import json
+import os
+from typing import List
+
+from arena_driver import RoundResult
+from standings import Standings
+
+
+class TournamentControl:
+    """
+    Adds the rounds to the standings, decides when the tournament is over and
+    saves the standings after every round. A tournament that was interrupted
+    continues from its checkpoint if the checkpoint is of the same tournament:
+    the same mode, bots, max rounds and seed. The checkpoint is removed when
+    the tournament is over.
+    """
+
+    def __init__(self, standings: Standings, mode: str, max_rounds: int, min_rounds: int, checkpoint: str = None,
+                 bots: List[str] = (), seed: int = None):
+        """
+        :param standings: the Standings, or DuplicateStandings counting deals
+        :param mode: the kind of tournament
+        :param max_rounds: the most rounds (deals) to play
+        :param min_rounds: the samples each bot needs before the tournament may stop early,
+            0 to always play max_rounds
+        :param checkpoint: the path of the checkpoint file, None for no checkpoints
+        :param bots: the names of the bots of the tournament
+        :param seed: the seed of the rounds, None for a fresh one per round
+        """
+        self._standings = standings
+        self._mode = mode
+        self._max_rounds = max_rounds
+        self._min_rounds = min_rounds
+        self._checkpoint = checkpoint
+        self._bots = sorted(bots)
+        self._seed = seed
+
+    def resume(self) -> bool:
+        """
+        Continue from the checkpoint if it is one of this tournament.
+        A checkpoint of another tournament is ignored and replaced by the first save.
+        :return: True if the standings were restored
+        """
+        if not self._checkpoint or not os.path.exists(self._checkpoint):
+            return False
+        try:
+            with open(self._checkpoint) as checkpoint:
+                saved = json.load(checkpoint)
+            identity = self.identity()
+            different = [key for key, value in identity.items() if saved.get(key) != value]
+            if different:
+                print(f'Checkpoint {self._checkpoint} is of another tournament '
+                      f'(different {", ".join(different)}), starting over.')
+                return False
+            self._standings.restore(saved['standings'])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f'Error: reading the checkpoint {self._checkpoint} failed: {e!r}, starting over.')
+            return False
+        print(f'Resuming the tournament after {self._standings.played} of {self._max_rounds} rounds.')
+        return True
+
+    def add_round(self, result: RoundResult) -> None:
+        """
+        Add a round to the standings and save the checkpoint.
+        :param result: the RoundResult
+        :return: None
+        """
+        self._standings.add_round(result)
+        self.save()
+
+    def save(self) -> None:
+        """
+        Write the checkpoint, replacing the old one at once so an interruption can't leave half a file.
+        :return: None
+        """
+        if not self._checkpoint:
+            return
+        temporary = f'{self._checkpoint}.tmp'
+        try:
+            with open(temporary, 'w') as checkpoint:
+                json.dump(dict(self.identity(), standings=self._standings.state()), checkpoint)
+            os.replace(temporary, self._checkpoint)
+        except OSError as e:
+            print(f'Error: writing the checkpoint {self._checkpoint} failed: {e!r}')
+
+    def finish(self) -> None:
+        """
+        Remove the checkpoint of a tournament that is over.
+        :return: None
+        """
+        if self._checkpoint and self.stop():
+            try:
+                os.remove(self._checkpoint)
+            except FileNotFoundError:
+                pass
+
+    def identity(self) -> dict:
+        """
+        What makes a checkpoint one of this tournament.
+        :return: dict with mode, bots, max_rounds and seed
+        """
+        return {'mode': self._mode, 'bots': self._bots, 'max_rounds': self._max_rounds, 'seed': self._seed}
+
+    def stop(self) -> bool:
+        """
+        Whether to start no more rounds.
+        :return: True at the max-rounds cap or once the ranking has converged
+        """
+        return self._standings.played >= self._max_rounds or self.converged
+
+    @property
+    def converged(self) -> bool:
+        """ returns True if stopping early is on and the ranking is settled """
+        return bool(self._min_rounds) and self._standings.converged(self._min_rounds)
+
+    @property
+    def remaining(self) -> int:
+        """ returns the rounds left up to the cap """
+        return max(0, self._max_rounds - self._standings.played)
+
+    @property
+    def standings(self) -> Standings:
+        """ returns the standings """
+        return self._standings